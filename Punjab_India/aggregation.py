@@ -0,0 +1,108 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import metrics
+from schema import COLUMN_ALIASES, normalize_columns
+
+# Rows read from the hourly export at a time
+CHUNK_SIZE = 100000
+
+# How each hourly Open-Meteo variable is rolled up into a day
+AGGREGATIONS = {
+    'temperature_2m (°C)': 'mean',
+    'relative_humidity_2m (%)': 'mean',
+    'precipitation (mm)': 'sum',
+    'et0_fao_evapotranspiration (mm)': 'sum',
+    'wind_speed_10m (km/h)': 'mean',
+    'soil_temperature_28_to_100cm (°C)': 'mean',
+    'soil_moisture_28_to_100cm (m³/m³)': 'mean',
+    'shortwave_radiation_instant (W/m²)': 'sum'
+}
+
+
+# Header lines of the data part of an export, single- and multi-location
+DATA_HEADERS = ('time,', 'location_id,time,')
+
+
+# Function to read the optional metadata block at the top of an Open-Meteo export.
+# The block (one row per location in multi-location exports) ends with a blank line before the data header.
+# Returns the metadata of the first location (empty if there is none) and the number of lines before the data header.
+def read_metadata(path):
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith(DATA_HEADERS) and (not lines or any(not seen.strip() for seen in lines)):
+                break
+            lines.append(line)
+        else:
+            raise ValueError(f"No data header found in {path}")
+
+    metadata = {}
+    if len(lines) >= 2 and lines[1].strip():
+        keys, values = next(csv.reader([lines[0]])), next(csv.reader([lines[1]]))
+        metadata = dict(zip(keys, values))
+    return metadata, len(lines)
+
+
+# Function to stream an hourly export and yield daily frames as soon as their days are complete.
+# Only the running sums and counts of the last, possibly partial day are kept between chunks.
+def iter_daily(path, chunk_size=CHUNK_SIZE):
+    _, skiprows = read_metadata(path)
+    pending = None
+    for chunk in pd.read_csv(path, skiprows=skiprows, chunksize=chunk_size, encoding='utf-8'):
+        keys = ['location_id', 'date'] if 'location_id' in chunk.columns else ['date']
+        columns = [column for column in AGGREGATIONS if column in chunk.columns]
+        # Open-Meteo times are ISO strings, so the day is the first ten characters
+        chunk['date'] = chunk['time'].str.slice(0, 10)
+
+        grouped = chunk.groupby(keys, sort=False)[columns]
+        totals = pd.concat({'sum': grouped.sum(), 'count': grouped.count()}, axis=1)
+        if pending is not None:
+            totals = pd.concat([pending, totals]).groupby(level=keys, sort=False).sum()
+
+        # The last day of the chunk may continue in the next one
+        pending = totals.iloc[-1:]
+        if len(totals) > 1:
+            yield _finish(totals.iloc[:-1], columns)
+
+    if pending is not None:
+        yield _finish(pending, columns)
+
+
+# Function to turn running sums and counts into the daily means and sums
+def _finish(totals, columns):
+    daily = pd.DataFrame(index=totals.index)
+    for column in columns:
+        if AGGREGATIONS[column] == 'mean':
+            daily[column] = totals[('sum', column)] / totals[('count', column)]
+        else:
+            daily[column] = totals[('sum', column)]
+    daily = normalize_columns(daily).reset_index()
+    daily['date'] = pd.to_datetime(daily['date'])
+    return daily
+
+
+# Function to aggregate a whole hourly export into daily data
+@metrics.instrument('daily_aggregation')
+def aggregate_daily(path, chunk_size=CHUNK_SIZE):
+    frames = list(iter_daily(path, chunk_size))
+    if not frames:
+        return pd.DataFrame(columns=['date'])
+    return pd.concat(frames, ignore_index=True)
+
+
+# Function to aggregate hourly rows already loaded with normalized names (e.g. from the weather store) into days
+def daily_from_hourly(hourly):
+    rules = {COLUMN_ALIASES.get(column, column): how for column, how in AGGREGATIONS.items()}
+    rules = {column: how for column, how in rules.items() if column in hourly.columns}
+    daily = hourly.groupby(hourly['time'].dt.floor('D'))[list(rules)].agg(rules)
+    daily.index.name = 'date'
+    return daily.reset_index()
+
+
+# Function to aggregate several exports in parallel, one file per worker process
+def aggregate_files(paths, processes=None, chunk_size=CHUNK_SIZE):
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return dict(zip(paths, pool.map(aggregate_daily, paths, [chunk_size] * len(paths))))
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+
+import pandas as pd
+from dotenv import load_dotenv
+
+import data_access
+import metrics
+from irrigation import CROPS
+
+# Days ahead of today covered by each alert horizon (0 = today only)
+HORIZONS = {'daily': 1, 'weekly': 7}
+
+# Local SQLite queue the alerts are written to; notifiers and the app read from it
+OUTBOX = os.getenv('ALERT_OUTBOX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alerts.db'))
+
+OUTBOX_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS irrigation_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    horizon TEXT NOT NULL,
+    site TEXT NOT NULL,
+    crop TEXT NOT NULL,
+    date TEXT NOT NULL,
+    irrigation_amount_mm REAL NOT NULL,
+    irrigation_needed INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    sent_at TEXT,
+    UNIQUE (horizon, site, crop, date, irrigation_amount_mm)
+)
+'''
+
+
+# Function to fetch the irrigation need of every crop and site for a date window in one query,
+# served by the (date, crop) index and the season partition the window falls in
+def fetch_upcoming(engine, start, end, crops=CROPS):
+    df = data_access.fetch_irrigation_need(engine, crops, None, start, end)
+    return df[['site', 'crop', 'date', 'irrigation_amount_mm']]
+
+
+# Function to turn irrigation needs into alert rows with the message shown to farmers
+def build_alerts(upcoming, horizon):
+    alerts = upcoming.copy()
+    alerts['horizon'] = horizon
+    alerts['irrigation_amount_mm'] = alerts['irrigation_amount_mm'].astype(float).round(2)
+    alerts['irrigation_needed'] = (alerts['irrigation_amount_mm'] > 0).astype(int)
+    days = alerts['date'].dt.strftime('%Y-%m-%d')
+    alerts['message'] = (
+        ('Irrigation needed on ' + days + ': ' + alerts['irrigation_amount_mm'].astype(str) + ' mm of water required')
+        .where(alerts['irrigation_needed'] == 1, 'No irrigation needed on ' + days)
+    )
+    alerts['date'] = days
+    return alerts
+
+
+# Function to open the outbox, creating it on first use
+def open_outbox(path=OUTBOX):
+    conn = sqlite3.connect(path)
+    conn.execute(OUTBOX_TABLE_SQL)
+    conn.execute('CREATE INDEX IF NOT EXISTS irrigation_alerts_date_idx ON irrigation_alerts (date, crop)')
+    return conn
+
+
+# Function to queue alerts, skipping any already queued with the same amount; returns how many were new
+def enqueue(conn, alerts):
+    created_at = pd.Timestamp.now().isoformat(timespec='seconds')
+    rows = [
+        (row.horizon, row.site, row.crop, row.date, row.irrigation_amount_mm, row.irrigation_needed,
+         row.message, created_at)
+        for row in alerts.itertuples(index=False)
+    ]
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT OR IGNORE INTO irrigation_alerts
+            (horizon, site, crop, date, irrigation_amount_mm, irrigation_needed, message, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn.total_changes - before
+
+
+# Function to get the alerts that have not been delivered yet
+def pending(conn, horizon=None):
+    query = 'SELECT * FROM irrigation_alerts WHERE sent_at IS NULL'
+    params = ()
+    if horizon is not None:
+        query += ' AND horizon = ?'
+        params = (horizon,)
+    return pd.read_sql_query(query + ' ORDER BY date, crop', conn, params=params)
+
+
+# Function to mark alerts as delivered by their ids
+def mark_sent(conn, ids):
+    sent_at = pd.Timestamp.now().isoformat(timespec='seconds')
+    conn.executemany('UPDATE irrigation_alerts SET sent_at = ? WHERE id = ?', [(sent_at, int(i)) for i in ids])
+    conn.commit()
+
+
+# Function to compute the alerts of every horizon and queue the new ones
+@metrics.instrument('alert_generation')
+def generate(engine, outbox=OUTBOX, horizons=HORIZONS, today=None):
+    today = pd.Timestamp(today or 'today').normalize()
+    conn = open_outbox(outbox)
+    try:
+        queued = {}
+        for horizon, days in horizons.items():
+            upcoming = fetch_upcoming(engine, today.date(), (today + pd.Timedelta(days=days)).date())
+            queued[horizon] = enqueue(conn, build_alerts(upcoming, horizon))
+    finally:
+        conn.close()
+    # Let the app drop its cached copy of the outbox
+    data_access.invalidate(['irrigation_alerts'])
+    return queued
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Queue upcoming irrigation alerts for every crop and site')
+    parser.add_argument('--outbox', default=OUTBOX, help='SQLite file the alerts are queued in')
+    parser.add_argument('--today', help='Day to compute the alerts from (YYYY-MM-DD), defaults to today')
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = data_access.get_engine(os.getenv('DATABASE_URL'))
+    for horizon, count in generate(engine, args.outbox, today=args.today).items():
+        print(f"{horizon}: {count} new alert(s)")
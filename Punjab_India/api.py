@@ -0,0 +1,255 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+import data_access
+import metrics
+import series
+from irrigation import CROPS
+from schema import WEATHER_COLUMNS
+
+# Port and interface the API listens on
+API_HOST = os.getenv('API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('API_PORT', 8600))
+
+# Optional columnar weather store the series are read from instead of the database (as in the app)
+WEATHER_STORE = os.getenv('WEATHER_STORE')
+WEATHER_SITE = os.getenv('WEATHER_SITE', 'punjab_2')
+
+# Responses smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+# Encoded responses kept in memory, dropped when the loader writes new data (same rules as the query cache)
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('API_CACHE_TTL', 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', 1024))
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+logger = logging.getLogger('smart_irrigation.api')
+
+# Columns a weather series can be asked for
+WEATHER_FIELDS = [column for column in WEATHER_COLUMNS.values() if column != 'date']
+
+
+# Raised for a request that cannot be answered; becomes an HTTP error response
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Function to get a single query parameter
+def _param(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+# Function to get a comma-separated list parameter, checked against the allowed values
+def _list_param(params, name, allowed):
+    value = _param(params, name)
+    if value is None:
+        return None
+    values = [item for item in value.split(',') if item]
+    unknown = [item for item in values if item not in allowed]
+    if unknown:
+        raise ApiError(400, f"Unknown {name}: {', '.join(unknown)}")
+    return values
+
+
+# Function to get the start and end parameters as dates
+def _date_range(params):
+    dates = []
+    for name in ('start', 'end'):
+        value = _param(params, name)
+        try:
+            dates.append(pd.Timestamp(value).date() if value else None)
+        except ValueError:
+            raise ApiError(400, f"Invalid {name} date: {value}")
+    return dates
+
+
+# Function to serve a weather series of a site: /api/historical and /api/forecast
+def _weather(engine, path, params):
+    site = _param(params, 'site', WEATHER_SITE)
+    # Without the weather store the database only holds the default site
+    if WEATHER_STORE is None and site != WEATHER_SITE:
+        raise ApiError(404, f"Unknown site: {site}")
+    columns = _list_param(params, 'columns', WEATHER_FIELDS) or WEATHER_FIELDS
+    start, end = _date_range(params)
+    return series.fetch_columns(engine, ROUTES[path][1], columns, start, end, WEATHER_STORE, site)
+
+
+# Function to serve the irrigation schedules of some sites and crops: /api/irrigation
+def _irrigation(engine, path, params):
+    crops = _list_param(params, 'crop', CROPS)
+    sites = [site for site in (_param(params, 'site') or '').split(',') if site] or None
+    start, end = _date_range(params)
+    return data_access.fetch_irrigation_need(engine, crops, sites, start, end)
+
+
+# Function to serve the crop parameters: /api/crops
+def _crops(engine, path, params):
+    return data_access.fetch_crop_parameters(engine, _list_param(params, 'crop', CROPS))
+
+
+# Handler of each endpoint, the table it reads (its cached responses are invalidated with it)
+# and the query parameters it takes; any other parameter is ignored
+ROUTES = {
+    '/api/historical': (_weather, 'historical_data', ('site', 'columns', 'start', 'end')),
+    '/api/forecast': (_weather, 'present_with_forecast', ('site', 'columns', 'start', 'end')),
+    '/api/irrigation': (_irrigation, 'irrigation_need', ('site', 'crop', 'start', 'end')),
+    '/api/crops': (_crops, 'crop_parameters', ('crop',))
+}
+
+
+# Function to encode a result as JSON records or as an Arrow IPC stream
+def encode(df, fmt):
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_CONTENT_TYPE
+    body = df.to_json(orient='records', date_format='iso', date_unit='s', force_ascii=False)
+    return body.encode('utf-8'), 'application/json; charset=utf-8'
+
+
+# Encoded response with its ETag; the gzipped body is made on first use and kept
+class _Response:
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=5)
+        return self._gzipped
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, and send the headers and body without waiting for ACKs
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    engine = None
+    cache = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            self._send(200, b'{"status": "ok"}', 'application/json')
+            return
+        if url.path not in ROUTES:
+            self._send_error(404, f"Unknown path: {url.path}")
+            return
+
+        params = parse_qs(url.query)
+        accept = self.headers.get('Accept', '')
+        fmt = _param(params, 'format') or ('arrow' if ARROW_CONTENT_TYPE in accept else 'json')
+        if fmt not in ('json', 'arrow'):
+            self._send_error(400, f"Unknown format: {fmt}")
+            return
+
+        try:
+            response = self._response(url.path, params, fmt)
+        except ApiError as e:
+            self._send_error(e.status, e.message)
+            return
+        except Exception:
+            # The details stay in the server log; clients only learn that the request failed
+            logger.exception('Request failed: %s', self.path)
+            self._send_error(500, 'Internal server error')
+            return
+
+        if response.etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, b'', None, response.etag)
+            return
+        if len(response.body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            self._send(200, response.gzipped(), response.content_type, response.etag, 'gzip')
+        else:
+            self._send(200, response.body, response.content_type, response.etag)
+
+    # Encoded response of a request, built once per distinct query while the data is unchanged
+    def _response(self, path, params, fmt):
+        route, table, accepted = ROUTES[path]
+        params = {name: params[name] for name in accepted if name in params}
+        # Keys start with the table so the loader's invalidation drops the right entries
+        key = (table, path, tuple((name, tuple(values)) for name, values in params.items()), fmt)
+        response = self.cache.get(key)
+        if response is None:
+            with self.cache.key_lock(key):
+                # Another request may have built it while we waited
+                response = self.cache.get(key)
+                if response is None:
+                    with metrics.timer(f"api_{path.rsplit('/', 1)[-1]}") as block:
+                        block.result = route(self.engine, path, params)
+                        response = _Response(*encode(block.result, fmt))
+                    self.cache.put(key, response)
+        return response
+
+    def _send(self, status, body, content_type, etag=None, encoding=None):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header('Content-Type', content_type)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept, Accept-Encoding')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode('utf-8'), 'application/json')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of connections while every worker thread is busy
+    request_queue_size = 256
+
+
+# Function to create the API server for an engine; call serve_forever() on it, or start() to run it in the background
+def make_server(engine, host=API_HOST, port=API_PORT):
+    cache = data_access.QueryCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+    handler = type('ApiHandler', (_ApiHandler,), {'engine': engine, 'cache': cache})
+    return _ApiServer((host, port), handler)
+
+
+# Function to run an API server on a background thread
+def start(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description='Serve the weather series and irrigation schedules over HTTP')
+    parser.add_argument('--host', default=API_HOST, help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=API_PORT, help='Port to listen on')
+    parser.add_argument('--database-url', help='Database URL (defaults to DATABASE_URL)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    server = make_server(data_access.get_engine(args.database_url or os.getenv('DATABASE_URL')), args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,132 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from aggregation import aggregate_daily
+from crop_calendar import kc_matrix
+from irrigation import CROPS, IRRIGATION_EFFICIENCY, THRESHOLD_SOIL_MOISTURE, WEATHER_VARIABLES, compute_irrigation
+
+# Irrigation quantities kept for every crop, site and day, in the order of the first axis of the output array
+OUTPUTS = ['etc', 'soil_deficit', 'irrigation_amount', 'irrigation_amount_per_hectare', 'gir']
+
+# Arrays shared with the worker processes, attached once per worker
+_worker = {}
+
+
+# Function to read a site manifest: one row per site with its hourly export, and optional per-crop sowing dates (MM-DD)
+def read_manifest(path):
+    sites = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            sowing = {crop: row[crop] for crop in CROPS if row.get(crop)}
+            # Relative export paths are taken from the manifest's directory
+            export = os.path.join(os.path.dirname(os.path.abspath(path)), row['path'])
+            sites.append({'site': row['site'], 'path': export, 'sowing': sowing})
+    return sites
+
+
+# Function to attach to a shared-memory block as a NumPy array
+def _attach(name, shape):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+# Function run once in every worker to attach the shared arrays and keep the run settings
+def _init_worker(weather_name, weather_shape, outputs_name, outputs_shape, dates, crops, threshold, efficiency):
+    _worker['weather_block'], _worker['weather'] = _attach(weather_name, weather_shape)
+    _worker['outputs_block'], _worker['outputs'] = _attach(outputs_name, outputs_shape)
+    _worker.update(dates=dates, crops=crops, threshold=threshold, efficiency=efficiency)
+
+
+# Function to aggregate, assign Kc and compute irrigation for one site, writing straight into the shared arrays
+def _run_site(task):
+    index, path, sowing = task
+    dates = _worker['dates']
+    daily = aggregate_daily(path).set_index('date').reindex(dates)
+    weather = _worker['weather'][index]
+    weather[:] = daily[WEATHER_VARIABLES].to_numpy()
+
+    kc = kc_matrix(dates, _worker['crops'], sowing or None)
+    result = compute_irrigation(weather[:, 0], weather[:, 1], weather[:, 2], kc,
+                                threshold=_worker['threshold'], efficiency=_worker['efficiency'])
+    for k, name in enumerate(OUTPUTS):
+        _worker['outputs'][k, :, index, :] = result[name]
+    return index
+
+
+# Function to compute irrigation schedules for every site in a manifest on a process pool.
+# Returns the dates, crops, sites, the (site, day, variable) weather array, the (output, crop, site, day)
+# irrigation array and the throughput in sites per second.
+def run(sites, start, end, crops=CROPS, processes=None,
+        threshold=THRESHOLD_SOIL_MOISTURE, efficiency=IRRIGATION_EFFICIENCY):
+    dates = pd.date_range(start, end, freq='D')
+    weather_shape = (len(sites), len(dates), len(WEATHER_VARIABLES))
+    outputs_shape = (len(OUTPUTS), len(crops), len(sites), len(dates))
+
+    weather_block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(weather_shape))) * 8)
+    outputs_block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(outputs_shape))) * 8)
+    weather = np.ndarray(weather_shape, dtype=np.float64, buffer=weather_block.buf)
+    outputs = np.ndarray(outputs_shape, dtype=np.float64, buffer=outputs_block.buf)
+    try:
+        weather[:] = np.nan
+        outputs[:] = np.nan
+
+        tasks = [(i, site['path'], site['sowing']) for i, site in enumerate(sites)]
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(weather_block.name, weather_shape, outputs_block.name, outputs_shape,
+                      dates, list(crops), threshold, efficiency)
+        ) as pool:
+            # A few chunks per worker keeps scheduling overhead low without leaving cores idle at the end
+            chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
+            for _ in pool.map(_run_site, tasks, chunksize=chunksize):
+                pass
+        elapsed = time.perf_counter() - started
+
+        return {
+            'dates': dates,
+            'crops': list(crops),
+            'sites': [site['site'] for site in sites],
+            'weather': weather.copy(),
+            'outputs': outputs.copy(),
+            'elapsed': elapsed,
+            'sites_per_second': len(sites) / elapsed if elapsed > 0 else float('inf')
+        }
+    finally:
+        del weather, outputs
+        weather_block.close()
+        weather_block.unlink()
+        outputs_block.close()
+        outputs_block.unlink()
+
+
+# Function to turn the irrigation array of a run into one long frame per (site, crop, date)
+def to_frame(result):
+    n_outputs, n_crops, n_sites, n_days = result['outputs'].shape
+    index = pd.MultiIndex.from_product([result['crops'], result['sites'], result['dates']], names=['crop', 'site', 'date'])
+    values = result['outputs'].reshape(n_outputs, -1).T
+    return pd.DataFrame(values, index=index, columns=OUTPUTS).reset_index()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compute irrigation schedules for every site in a manifest')
+    parser.add_argument('manifest', help='CSV with site and path columns, plus optional per-crop sowing dates')
+    parser.add_argument('--start', required=True, help='First day of the schedules (YYYY-MM-DD)')
+    parser.add_argument('--end', required=True, help='Last day of the schedules (YYYY-MM-DD)')
+    parser.add_argument('--processes', type=int, help='Worker processes (defaults to the number of cores)')
+    parser.add_argument('--output', help='Write the long-format schedules to this Parquet file')
+    args = parser.parse_args()
+
+    result = run(read_manifest(args.manifest), args.start, args.end, processes=args.processes)
+    print(f"{len(result['sites'])} sites in {result['elapsed']:.2f} s ({result['sites_per_second']:.1f} sites/s)")
+    if args.output:
+        to_frame(result).to_parquet(args.output, index=False)
@@ -0,0 +1,202 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import data_access
+import scenarios
+import water_balance
+import weather_store
+from crop_calendar import kc_matrix
+from irrigation import CROPS, compute_irrigation
+from schema import WEATHER_COLUMNS
+
+# File the results of every run are appended to
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.jsonl')
+
+# Table the database stages load and query
+BENCHMARK_TABLE = 'benchmark_weather'
+
+# A stage counts as a regression when it is this much slower than the previous run with the same parameters
+REGRESSION_TOLERANCE = 0.20
+
+HOURLY_HEADER = [
+    'time', 'temperature_2m (°C)', 'relative_humidity_2m (%)', 'precipitation (mm)',
+    'et0_fao_evapotranspiration (mm)', 'wind_speed_10m (km/h)', 'soil_temperature_28_to_100cm (°C)',
+    'soil_moisture_28_to_100cm (m³/m³)', 'shortwave_radiation_instant (W/m²)'
+]
+
+
+# Function to generate Open-Meteo shaped hourly data for one site, with daily and yearly cycles
+def synthetic_hourly(years, start_year=2020, seed=0):
+    rng = np.random.default_rng(seed)
+    time_index = pd.date_range(f"{start_year}-01-01", f"{start_year + years - 1}-12-31 23:00", freq='h')
+    hour = time_index.hour.to_numpy()
+    day_of_year = time_index.dayofyear.to_numpy()
+    n = len(time_index)
+    season = np.sin(2 * np.pi * (day_of_year - 100) / 365)
+    daylight = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None)
+
+    return pd.DataFrame({
+        'time': time_index.strftime('%Y-%m-%dT%H:%M'),
+        'temperature_2m (°C)': (22 + 10 * season + 6 * daylight + rng.normal(0, 1.5, n)).round(1),
+        'relative_humidity_2m (%)': np.clip(70 - 20 * daylight + rng.normal(0, 8, n), 5, 100).round(),
+        'precipitation (mm)': np.where(rng.random(n) < 0.03, rng.exponential(2, n), 0).round(2),
+        'et0_fao_evapotranspiration (mm)': (0.35 * daylight * (1 + 0.5 * season)).clip(0).round(2),
+        'wind_speed_10m (km/h)': rng.gamma(2, 3, n).round(1),
+        'soil_temperature_28_to_100cm (°C)': (24 + 8 * season + rng.normal(0, 0.2, n)).round(1),
+        'soil_moisture_28_to_100cm (m³/m³)': (0.27 + 0.04 * np.sin(2 * np.pi * (day_of_year - 200) / 365)
+                                             + rng.normal(0, 0.005, n)).round(3),
+        'shortwave_radiation_instant (W/m²)': (800 * daylight * (1 + 0.2 * season)).round(1)
+    })[HOURLY_HEADER]
+
+
+# Function to write synthetic exports for n_sites sites and return their paths
+def generate_sites(out_dir, n_sites, years):
+    paths = []
+    for site in range(n_sites):
+        path = os.path.join(out_dir, f"site_{site}.csv")
+        synthetic_hourly(years, seed=site).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+# Function to time a callable, keeping the best of several repeats
+def timed(function, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+# Function to time every pipeline stage on synthetic data
+def run(n_sites, years, repeat=3):
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_sites(tmp, n_sites, years)
+
+        timings['csv_load'], _ = timed(lambda: [pd.read_csv(path) for path in paths], repeat)
+        timings['daily_aggregation'], dailies = timed(lambda: [aggregation.aggregate_daily(path) for path in paths], repeat)
+
+        store = os.path.join(tmp, 'store')
+        timings['parquet_ingest'], _ = timed(
+            lambda: [weather_store.ingest_csv(path, store, site=f"s{i}") for i, path in enumerate(paths)], 1)
+        timings['parquet_load'], _ = timed(
+            lambda: [weather_store.read(store, 'hourly', f"s{i}") for i in range(n_sites)], repeat)
+
+        daily = pd.concat(dailies, ignore_index=True)
+        dates = daily['date'].to_numpy()
+        timings['kc_assignment'], kc = timed(lambda: kc_matrix(dates, CROPS), repeat)
+        timings['irrigation'], _ = timed(lambda: compute_irrigation(
+            daily['ET₀ (mm)'].to_numpy(), daily['precipitation (mm)'].to_numpy(),
+            daily['soil_moisture_28_to_100cm (m³/m³)'].to_numpy(), kc), repeat)
+        timings['water_balance'], _ = timed(lambda: water_balance.run(dailies[0]), repeat)
+        history = dailies[0].set_index('date')
+        timings['scenarios'], _ = timed(lambda: scenarios.run(history=history, method='bootstrap', seed=0), repeat)
+
+        table = dailies[0][list(WEATHER_COLUMNS)].rename(columns=WEATHER_COLUMNS)
+        database_url = os.getenv('DATABASE_URL')
+        if database_url:
+            # Loaded the way the pipeline loads, into a table of its own that is dropped afterwards
+            import loader
+
+            conn = loader.get_connection()
+            frame = loader.to_table_columns(dailies[0], WEATHER_COLUMNS)
+            timings['db_load'], _ = timed(lambda: loader.load_frame(
+                conn, frame, BENCHMARK_TABLE, loader.WEATHER_TABLE_SQL, mode='replace'), 1)
+            engine = data_access.get_engine(database_url)
+        else:
+            # SQLite stands in for PostgreSQL so the query stages run anywhere; there is no COPY load to time
+            conn = None
+            engine = data_access.get_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            table.assign(date=table['date'].dt.date).to_sql(BENCHMARK_TABLE, engine, index=False)
+
+        # The app's query path: fetch_table for a year of two columns
+        start = (table['date'].max() - pd.Timedelta(days=365)).date()
+
+        def query():
+            return data_access.fetch_table(engine, BENCHMARK_TABLE, ['date', 'temperature_2m_c'], start)
+
+        try:
+            data_access.invalidate()
+            timings['query_cold'], _ = timed(query, 1)
+            timings['query_warm'], _ = timed(query, repeat)
+        finally:
+            data_access.invalidate()
+            if conn is not None:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}")
+                conn.commit()
+                conn.close()
+            else:
+                engine.dispose()
+
+    return timings
+
+
+# Function to get the commit the benchmark ran on, if the tree is a git checkout
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Function to find stages that got slower than the previous run with the same parameters and database
+def regressions(record, results_file=RESULTS_FILE):
+    if not os.path.exists(results_file):
+        return {}
+    previous = None
+    with open(results_file, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if (entry['sites'], entry['years'], entry.get('database', 'sqlite')) == \
+                    (record['sites'], record['years'], record['database']):
+                previous = entry
+    if previous is None:
+        return {}
+    return {
+        stage: (previous['timings'][stage], seconds)
+        for stage, seconds in record['timings'].items()
+        if stage in previous['timings'] and seconds > previous['timings'][stage] * (1 + REGRESSION_TOLERANCE)
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic Open-Meteo data')
+    parser.add_argument('--sites', type=int, nargs='+', default=[1, 4], help='Site counts to run (one run each)')
+    parser.add_argument('--years', type=int, default=4, help='Years of hourly data per site')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeats per stage, best time is kept')
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSON lines file the results are appended to')
+    args = parser.parse_args()
+
+    load_dotenv()
+    for n_sites in args.sites:
+        record = {
+            'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'sites': n_sites,
+            'years': args.years,
+            'database': 'postgresql' if os.getenv('DATABASE_URL') else 'sqlite',
+            'timings': run(n_sites, args.years, args.repeat)
+        }
+        print(f"{n_sites} site(s) x {args.years} year(s)")
+        for stage, seconds in record['timings'].items():
+            print(f"  {stage:<18} {seconds * 1000:10.1f} ms")
+        for stage, (before, after) in regressions(record, args.results).items():
+            print(f"  REGRESSION {stage}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
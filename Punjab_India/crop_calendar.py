@@ -0,0 +1,201 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from irrigation import CROPS
+
+# Kc and stage used for days that fall outside every growth stage
+DEFAULT_KC = 0.35
+DEFAULT_STAGE = 'Unknown'
+
+# Sowing year of the notebook's seasons; crops whose season lasts longer than a year are sown every
+# few years counting from it, so one season is never cut short by the next
+SEASON_ANCHOR_YEAR = 2022
+
+# Growth stages per crop as (start MM-DD, end MM-DD, Kc, stage), in order from sowing.
+# A boundary earlier in the year than the one before it belongs to the following year.
+# An end on 02-28 stands for the end of February, so leap days stay in the stage.
+GROWTH_STAGES = {
+    'Wheat': [
+        ('10-01', '10-30', 0.35, 'Initial'),
+        ('11-01', '12-10', 0.75, 'Crop Development'),
+        ('12-11', '02-10', 1.1, 'Heading & Grain filling'),
+        ('02-11', '04-10', 0.7, 'Maturity & Ripening')
+    ],
+    'Rice': [
+        ('05-01', '05-30', 1.0, 'Initial'),
+        ('06-01', '07-31', 1.2, 'Crop Development'),
+        ('08-01', '10-31', 1.2, 'Mid-Season'),
+        ('11-01', '03-10', 0.8, 'Late Season')
+    ],
+    'Maize': [
+        ('10-01', '10-31', 0.4, 'Initial'),
+        ('11-01', '12-31', 0.775, 'Development'),
+        ('01-01', '02-28', 1.125, 'Mid-Season'),
+        ('03-01', '04-30', 0.85, 'Late Season')
+    ],
+    'Sugarcane': [
+        ('10-01', '12-31', 0.4, 'Initial'),
+        ('01-01', '03-31', 0.85, 'Tillering and Shooting'),
+        ('04-01', '09-30', 1.2, 'Canopy Development'),
+        ('10-01', '12-31', 0.75, 'Maturity & Ripening')
+    ],
+    'Cotton': [
+        ('04-01', '05-31', 0.45, 'Initial'),
+        ('06-01', '07-31', 0.75, 'Crop Development'),
+        ('08-01', '10-31', 1.15, 'Flowering & Boll Development'),
+        ('11-01', '12-31', 0.75, 'Maturity')
+    ],
+    'Barley': [
+        ('10-01', '10-30', 0.3, 'Initial'),
+        ('11-01', '12-10', 0.7, 'Crop Development'),
+        ('12-11', '02-10', 1.15, 'Heading & Grain filling'),
+        ('02-11', '04-10', 0.7, 'Maturity & Ripening')
+    ],
+    'Potatoes': [
+        ('01-01', '02-28', 0.5, 'Initial'),
+        ('03-01', '04-30', 0.8, 'Crop Development'),
+        ('05-01', '06-30', 1.15, 'Tuber Formation'),
+        ('07-01', '08-31', 0.75, 'Maturity')
+    ],
+    'Pulses': [
+        ('10-01', '10-30', 0.4, 'Initial'),
+        ('11-01', '12-10', 0.7, 'Crop Development'),
+        ('12-11', '02-10', 1.05, 'Flowering and Pod Development'),
+        ('02-11', '04-10', 0.8, 'Pod Filling and Maturation')
+    ]
+}
+
+
+# Compiled growth-stage calendar of one crop, repeatable over any range of seasons
+class CropCalendar:
+    def __init__(self, crop, stages):
+        self.crop = crop
+        self.kc = np.array([stage[2] for stage in stages] + [DEFAULT_KC])
+        self.stages = np.array([stage[3] for stage in stages] + [DEFAULT_STAGE], dtype=object)
+
+        # Work out which season year each boundary falls in, relative to the sowing year
+        self._boundaries = []
+        year_offset = 0
+        previous = None
+        for start, end, _, _ in stages:
+            if previous is not None and start < previous:
+                year_offset += 1
+            start_offset = year_offset
+            if end < start:
+                year_offset += 1
+            self._boundaries.append((start_offset, start, year_offset, end))
+            previous = end
+        self.sowing = stages[0][0]
+        # Years between two sowings: one, or more for a season longer than a year (Sugarcane)
+        self.cycle_years = math.ceil(self.season_days() / 365)
+
+    # Function to lay the stages out as sorted, non-overlapping [start, end] day intervals for a range of seasons.
+    # When a season lasts longer than a year, the season already in the field keeps the days it overlaps.
+    @lru_cache(maxsize=32)
+    def intervals(self, first_year, last_year):
+        starts, ends, stage_index = [], [], []
+        occupied_until = None
+        for year in range(first_year, last_year + 1):
+            if (year - SEASON_ANCHOR_YEAR) % self.cycle_years:
+                continue
+            for i, (start_offset, start, end_offset, end) in enumerate(self._boundaries):
+                stage_start = np.datetime64(f"{year + start_offset}-{start}", 'D')
+                stage_end = _end_day(year + end_offset, end)
+                if occupied_until is not None and stage_start <= occupied_until:
+                    stage_start = occupied_until + 1
+                if stage_start > stage_end:
+                    continue
+                starts.append(stage_start)
+                ends.append(stage_end)
+                stage_index.append(i)
+            occupied_until = max(ends) if ends else None
+        return np.array(starts, dtype='datetime64[D]'), np.array(ends, dtype='datetime64[D]'), np.array(stage_index, dtype=np.int64)
+
+    # Function to find the stage of every date. shift_days moves the calendar later by that many days
+    # (a scalar, or one value per date for per-site sowing dates).
+    def stage_index(self, dates, shift_days=0):
+        dates = np.asarray(dates, dtype='datetime64[D]') - np.asarray(shift_days, dtype='timedelta64[D]')
+        if dates.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Seasons can start up to two years (plus a sowing cycle) before the first date and still be running
+        first_year = int(dates.min().astype('datetime64[Y]').astype(int)) + 1970 - 2 - self.cycle_years
+        last_year = int(dates.max().astype('datetime64[Y]').astype(int)) + 1970
+        starts, ends, stage_index = self.intervals(first_year, last_year)
+
+        position = np.searchsorted(starts, dates, side='right') - 1
+        inside = position >= 0
+        inside[inside] = dates[inside] <= ends[position[inside]]
+        result = np.full(dates.shape, len(self.kc) - 1, dtype=np.int64)
+        result[inside] = stage_index[position[inside]]
+        return result
+
+    def lookup(self, dates, shift_days=0):
+        index = self.stage_index(dates, shift_days)
+        return self.kc[index], self.stages[index]
+
+    # Function to get the length of one season in days, from sowing to the end of the last stage
+    def season_days(self):
+        _, _, end_offset, end = self._boundaries[-1]
+        return int((np.datetime64(f"{2001 + end_offset}-{end}") - np.datetime64(f"2001-{self.sowing}")).astype(int)) + 1
+
+    # Function to get the first and last day of the season running in season_year: the one sown that year, or for
+    # a crop sown every few years, the one sown in the last sowing year before it (as the crop_season rollup counts)
+    def season_window(self, season_year):
+        year = season_year - (season_year - SEASON_ANCHOR_YEAR) % self.cycle_years
+        start = np.datetime64(f"{year}-{self.sowing}", 'D')
+        return start, start + self.season_days() - 1
+
+    # Function to convert a site's sowing date (MM-DD) into the shift applied to this calendar
+    def sowing_shift(self, sowing):
+        return int((np.datetime64(f"2001-{sowing}") - np.datetime64(f"2001-{self.sowing}")).astype(int))
+
+
+# Function to get the date of an end boundary, taking 02-28 as the last day of February
+def _end_day(year, end):
+    if end == '02-28':
+        return np.datetime64(f"{year}-03-01", 'D') - 1
+    return np.datetime64(f"{year}-{end}", 'D')
+
+
+CALENDARS = {crop: CropCalendar(crop, stages) for crop, stages in GROWTH_STAGES.items()}
+
+
+# Function to get the Kc of every crop for every date as a (crop, day) array, ready for irrigation.compute_irrigation.
+# sowing optionally maps a crop to its sowing date (MM-DD), either one for all rows or one per row.
+@metrics.instrument('kc_assignment')
+def kc_matrix(dates, crops=CROPS, sowing=None):
+    dates = np.asarray(dates)
+    if dates.dtype.kind != 'M':
+        dates = pd.to_datetime(dates).to_numpy()
+    dates = dates.astype('datetime64[D]')
+    kc = np.empty((len(crops), len(dates)))
+    for i, crop in enumerate(crops):
+        kc[i] = CALENDARS[crop].lookup(dates, _shift(crop, sowing))[0]
+    return kc
+
+
+# Function to add the Kc and growth_stage columns for one crop to a daily dataframe
+def assign_kc(df, crop, sowing=None):
+    kc, stages = CALENDARS[crop].lookup(df['date'].to_numpy(dtype='datetime64[D]'), _shift(crop, sowing))
+    df = df.copy()
+    df['crop'] = crop
+    df['Kc'] = kc
+    df['growth_stage'] = stages
+    return df
+
+
+# Function to turn a sowing date, or per-row sowing dates, into calendar shifts in days
+def _shift(crop, sowing):
+    if sowing is None or crop not in sowing:
+        return 0
+    calendar = CALENDARS[crop]
+    value = sowing[crop]
+    if isinstance(value, str):
+        return calendar.sowing_shift(value)
+    days, inverse = np.unique(np.asarray(value), return_inverse=True)
+    return np.array([calendar.sowing_shift(day) for day in days])[inverse]
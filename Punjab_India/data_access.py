@@ -0,0 +1,324 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, text
+
+import metrics
+from crop_calendar import CALENDARS
+from irrigation import CROPS, IRRIGATION_EFFICIENCY
+
+# Connection pool settings for the shared engine
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# Result cache settings
+CACHE_TTL_SECONDS = float(os.getenv('QUERY_CACHE_TTL', 600))
+CACHE_MAX_ENTRIES = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 256))
+
+# Locks a cache spreads its keys over while one caller fills an entry
+KEY_LOCK_STRIPES = 64
+
+# File touched by the loader after every write, so every process running the app drops its cache
+DATA_VERSION_FILE = os.getenv(
+    'DATA_VERSION_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data_version')
+)
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+# Function to get the single pooled engine for a database URL (one per process)
+def get_engine(database_url):
+    with _engine_lock:
+        engine = _engines.get(database_url)
+        if engine is None:
+            with metrics.timer('create_engine'):
+                if database_url.startswith('sqlite'):
+                    engine = create_engine(database_url)
+                else:
+                    engine = create_engine(
+                        database_url,
+                        pool_size=POOL_SIZE,
+                        max_overflow=MAX_OVERFLOW,
+                        pool_recycle=POOL_RECYCLE_SECONDS,
+                        pool_pre_ping=True
+                    )
+            _engines[database_url] = engine
+        return engine
+
+
+# Function to read the current data version written by the loader
+def _current_data_version():
+    try:
+        return os.stat(DATA_VERSION_FILE).st_mtime_ns
+    except OSError:
+        return 0
+
+
+# Time-to-live result cache with least-recently-used eviction
+class QueryCache:
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._version = _current_data_version()
+
+    # Drop everything if the loader has written new data since we last looked
+    def _check_version(self):
+        version = _current_data_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key):
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Lock shared by all callers asking for the same key, so only one of them hits the database.
+    # Keys share a fixed set of locks, so the table stays bounded however many distinct keys are asked for.
+    def key_lock(self, key):
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def invalidate(self, tables=None):
+        with self._lock:
+            if tables is None:
+                self._entries.clear()
+                return
+            tables = {table.lower() for table in tables}
+            for key in [key for key in self._entries if key[0] in tables]:
+                del self._entries[key]
+
+
+_cache = QueryCache()
+
+
+# Function to check that a table or column name is safe to place in SQL.
+# Word characters only, so names like et₀_mm (subscript digit, not a Python identifier) pass.
+def _check_identifier(name):
+    if not re.fullmatch(r'[^\W\d]\w*', name):
+        raise ValueError(f"Invalid identifier: {name}")
+    return name
+
+
+# Function to fetch columns of a table for an optional date range, served from the cache when warm
+def fetch_table(engine, table, columns=None, start=None, end=None, date_column='date'):
+    table = _check_identifier(table.lower())
+    columns = tuple(columns) if columns else None
+    key = (table, columns, start, end, date_column, str(engine.url))
+
+    return _cached(key, lambda: _read_table(engine, table, columns, start, end, date_column)).copy()
+
+
+# Function to fetch the first and last date stored in a table
+def fetch_date_range(engine, table, date_column='date'):
+    table = _check_identifier(table.lower())
+    date_column = _check_identifier(date_column)
+    key = (table, ('min', date_column, 'max'), None, None, str(engine.url))
+
+    def read():
+        query = f"SELECT MIN({date_column}) AS first_date, MAX({date_column}) AS last_date FROM {table}"
+        with engine.connect() as conn:
+            row = conn.execute(text(query)).one()
+        if row.first_date is None:
+            return None, None
+        return pd.Timestamp(row.first_date), pd.Timestamp(row.last_date)
+
+    return _cached(key, read)
+
+
+# Function to fetch the weekly, monthly or seasonal rollup of one weather variable, maintained by the loader
+def fetch_weather_rollup(engine, source_table, variable, period='month'):
+    source_table = _check_identifier(source_table.lower())
+    key = ('weather_rollup', (source_table, variable), period, None, str(engine.url))
+
+    def read():
+        query = '''
+            SELECT period_start, mean, total, minimum, maximum, days FROM weather_rollup
+            WHERE source_table = :source_table AND variable = :variable AND period = :period
+            ORDER BY period_start
+        '''
+        return _read_rollup(engine, query, {'source_table': source_table, 'variable': variable, 'period': period})
+
+    return _cached(key, read).copy()
+
+
+# Function to fetch a crop's irrigation totals per period at a site; period='crop_season' gives the growing-season water use
+def fetch_irrigation_totals(engine, crop, site, period='crop_season'):
+    key = ('irrigation_rollup', (crop, site), period, None, str(engine.url))
+
+    def read():
+        query = '''
+            SELECT period_start, irrigation_amount_mm, irrigation_amount_per_hectare_litre,
+                   gross_irrigation_mm, irrigation_days
+            FROM irrigation_rollup
+            WHERE site = :site AND crop = :crop AND period = :period
+            ORDER BY period_start
+        '''
+        return _read_rollup(engine, query, {'site': site, 'crop': crop, 'period': period})
+
+    return _cached(key, read).copy()
+
+
+# Function to run a rollup query
+def _read_rollup(engine, query, params):
+    df = _read_query(engine, text(query), params)
+    df['period_start'] = pd.to_datetime(df['period_start'])
+    return df
+
+
+# Function to run a query with bound parameters, parsing its date column
+@metrics.instrument('db_query')
+def _read_query(engine, query, params):
+    with engine.connect() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+# Function to fetch the irrigation need of some crops and sites for an optional date range in one query
+def fetch_irrigation_need(engine, crops=None, sites=None, start=None, end=None):
+    crops = tuple(crops) if crops else None
+    sites = tuple(sites) if sites else None
+    key = ('irrigation_need', (crops, sites), start, end, str(engine.url))
+
+    def read():
+        conditions, params, expanding = [], {}, []
+        for column, values in (('crop', crops), ('site', sites)):
+            if values is not None:
+                conditions.append(f"{column} IN :{column}s")
+                params[f"{column}s"] = list(values)
+                expanding.append(bindparam(f"{column}s", expanding=True))
+        if start is not None:
+            conditions.append("date >= :start")
+            params['start'] = start
+        if end is not None:
+            conditions.append("date <= :end")
+            params['end'] = end
+        query = '''
+            SELECT site, crop, date, irrigation_amount_mm, irrigation_amount_per_hectare_litre, growth_stage
+            FROM irrigation_need
+        '''
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY site, crop, date"
+        return _read_query(engine, text(query).bindparams(*expanding), params)
+
+    return _cached(key, read).copy()
+
+
+# Function to fetch the parameters of some crops (all crops by default)
+def fetch_crop_parameters(engine, crops=None):
+    crops = tuple(crops) if crops else None
+    key = ('crop_parameters', crops, None, None, str(engine.url))
+
+    def read():
+        query = text("SELECT * FROM crop_parameters" + (" WHERE crop IN :crops" if crops else "") + " ORDER BY crop")
+        if crops:
+            return _read_query(engine, query.bindparams(bindparam('crops', expanding=True)), {'crops': list(crops)})
+        return _read_query(engine, query, {})
+
+    return _cached(key, read).copy()
+
+
+# Function to compare the water used by smart and traditional irrigation for every crop over the growing
+# season running in season_year at a site (crop_calendar.season_window, the same seasons as the crop_season
+# rollup), in a single query over the (site, crop, date) key
+def fetch_season_comparison(engine, season_year, site, efficiency=IRRIGATION_EFFICIENCY):
+    key = ('irrigation_need', ('season_comparison', site, efficiency), season_year, None, str(engine.url))
+
+    def read():
+        seasons = []
+        params = {'site': site, 'efficiency': efficiency}
+        for i, crop in enumerate(CROPS):
+            start, end = CALENDARS[crop].season_window(season_year)
+            seasons.append(f"(:crop_{i}, :start_{i}, :end_{i})")
+            params.update({f"crop_{i}": crop, f"start_{i}": start.item(), f"end_{i}": end.item()})
+        query = text(f'''
+            WITH seasons (crop, season_start, season_end) AS (VALUES {', '.join(seasons)})
+            SELECT p.crop, p.traditional_irrigation_mm,
+                   COALESCE(SUM(n.irrigation_amount_mm), 0) / :efficiency AS smart_irrigation_mm
+            FROM crop_parameters p
+            JOIN seasons s ON s.crop = p.crop
+            LEFT JOIN irrigation_need n
+              ON n.site = :site AND n.crop = p.crop
+             AND n.date >= s.season_start AND n.date <= s.season_end
+            GROUP BY p.crop, p.traditional_irrigation_mm
+            ORDER BY p.crop
+        ''')
+        return _read_query(engine, query, params)
+
+    return _cached(key, read).copy()
+
+
+# Function to return the cached value for a key, running the loader once if it is missing.
+# Keys start with the table (for invalidate) and end with the engine URL, so databases never share entries.
+def _cached(key, loader):
+    value = _cache.get(key)
+    if value is None:
+        with _cache.key_lock(key):
+            # Another session may have filled the entry while we waited
+            value = _cache.get(key)
+            if value is None:
+                value = loader()
+                _cache.put(key, value)
+    return value
+
+
+# Function to run the query behind fetch_table
+@metrics.instrument('db_query')
+def _read_table(engine, table, columns, start, end, date_column):
+    select_list = ', '.join(_check_identifier(column) for column in columns) if columns else '*'
+    query = f"SELECT {select_list} FROM {table}"
+    params = {}
+    # Tables without a date column (e.g. the crop details) are read as they are
+    if date_column is not None:
+        date_column = _check_identifier(date_column)
+        conditions = []
+        if start is not None:
+            conditions.append(f"{date_column} >= :start")
+            params['start'] = start
+        if end is not None:
+            conditions.append(f"{date_column} <= :end")
+            params['end'] = end
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if columns is None or date_column in columns:
+            query += f" ORDER BY {date_column}"
+
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text(query), conn, params=params)
+    if date_column is not None and date_column in df.columns:
+        df[date_column] = pd.to_datetime(df[date_column])
+    return df
+
+
+# Function to drop cached results, called by the loader after it writes new data
+def invalidate(tables=None):
+    _cache.invalidate(tables)
+    with open(DATA_VERSION_FILE, 'a'):
+        os.utime(DATA_VERSION_FILE, None)
@@ -0,0 +1,149 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.api import VAR
+
+# Forecast horizon in days
+FORECAST_STEPS = 14
+
+# Largest lag order tried when the model is refitted
+MAX_LAGS = 15
+
+# Days of new data after which the model is refitted instead of just updated
+REFIT_EVERY_DAYS = 30
+
+# Forecasts kept in memory, keyed by (site, last observed date)
+FORECAST_CACHE_SIZE = 1024
+
+# Default directory for the persisted models
+MODEL_DIR = os.getenv('FORECAST_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+
+
+# Function to fit a VAR model on the differenced daily history and keep only what forecasting needs
+def fit_model(history, max_lags=MAX_LAGS):
+    history = history.dropna()
+    diff = history.diff().dropna()
+    model_fit = VAR(diff).fit(maxlags=max_lags, ic='aic')
+    k_ar = model_fit.k_ar
+    return {
+        'columns': list(history.columns),
+        'k_ar': k_ar,
+        'intercept': np.asarray(model_fit.intercept, dtype=float),
+        'coefs': np.asarray(model_fit.coefs, dtype=float).reshape(k_ar, len(history.columns), len(history.columns)),
+        # Residual covariance, used to sample weather scenarios around the forecast
+        'sigma': np.asarray(model_fit.sigma_u, dtype=float),
+        'fitted_until': history.index[-1],
+        # The last k_ar + 1 levels are enough to difference, forecast and undo the differencing
+        'levels': history.to_numpy(dtype=float)[-(k_ar + 1):],
+        'last_date': history.index[-1]
+    }
+
+
+# Function to append newly observed days to a model without refitting it.
+# The recursion assumes consecutive days, so new rows that leave a gap return None: the model must be refitted.
+def update_model(state, new_rows):
+    new_rows = new_rows[new_rows.index > state['last_date']][state['columns']].dropna()
+    if new_rows.empty:
+        return state
+    expected = pd.date_range(state['last_date'] + pd.Timedelta(days=1), periods=len(new_rows), freq='D')
+    if not new_rows.index.equals(expected):
+        return None
+    levels = np.vstack([state['levels'], new_rows.to_numpy(dtype=float)])
+    return dict(state, levels=levels[-(state['k_ar'] + 1):], last_date=new_rows.index[-1])
+
+
+# Function to forecast the next days from a model's coefficients and its last observed levels
+def forecast(state, steps=FORECAST_STEPS):
+    k_ar = state['k_ar']
+    diffs = list(np.diff(state['levels'], axis=0)[-k_ar:]) if k_ar else []
+    predicted = []
+    for _ in range(steps):
+        step = state['intercept'].copy()
+        for lag in range(k_ar):
+            step += state['coefs'][lag] @ diffs[-1 - lag]
+        diffs.append(step)
+        predicted.append(step)
+
+    # Reverse the differencing from the last observed levels
+    values = np.cumsum(np.array(predicted).reshape(steps, -1), axis=0) + state['levels'][-1]
+    dates = pd.date_range(state['last_date'] + pd.Timedelta(days=1), periods=steps, freq='D')
+    return pd.DataFrame(values, index=dates, columns=state['columns'])
+
+
+# Function to save a model's coefficients, lag order and last levels
+def save_model(state, path):
+    np.savez(path,
+             intercept=state['intercept'], coefs=state['coefs'], sigma=state['sigma'], levels=state['levels'],
+             meta=json.dumps({
+                 'columns': state['columns'],
+                 'k_ar': state['k_ar'],
+                 'fitted_until': str(state['fitted_until']),
+                 'last_date': str(state['last_date'])
+             }))
+
+
+# Function to load a saved model, or None if there is none (or it predates the stored residual covariance)
+def load_model(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if 'sigma' not in data.files:
+            return None
+        meta = json.loads(str(data['meta']))
+        return {
+            'columns': meta['columns'],
+            'k_ar': meta['k_ar'],
+            'intercept': data['intercept'],
+            'coefs': data['coefs'],
+            'sigma': data['sigma'],
+            'fitted_until': pd.Timestamp(meta['fitted_until']),
+            'levels': data['levels'],
+            'last_date': pd.Timestamp(meta['last_date'])
+        }
+
+
+# Per-site forecasting with persisted models, scheduled refits and a forecast cache
+class ForecastService:
+    def __init__(self, load_history, model_dir=MODEL_DIR, refit_every_days=REFIT_EVERY_DAYS,
+                 cache_size=FORECAST_CACHE_SIZE):
+        # load_history(site) returns the full daily history of a site, indexed by date; only used to (re)fit
+        self.load_history = load_history
+        self.model_dir = model_dir
+        self.refit_every = pd.Timedelta(days=refit_every_days)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        os.makedirs(model_dir, exist_ok=True)
+
+    def _model_path(self, site):
+        return os.path.join(self.model_dir, f"{site}.npz")
+
+    # Function to bring a site's model up to date: new days are appended, and the model is refitted on schedule
+    # or when the new days do not follow on from the model's last day
+    def refresh(self, site, new_rows=None):
+        path = self._model_path(site)
+        state = load_model(path)
+        updated = state
+        if state is not None and new_rows is not None:
+            updated = update_model(state, new_rows)
+        if updated is None or updated['last_date'] - updated['fitted_until'] >= self.refit_every:
+            updated = fit_model(self.load_history(site))
+        if updated is not state:
+            save_model(updated, path)
+        return updated
+
+    # Function to get a site's forecast, computing it only once per last observed date
+    def forecast(self, site, new_rows=None, steps=FORECAST_STEPS):
+        state = self.refresh(site, new_rows)
+        key = (site, state['last_date'], steps)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key].copy()
+
+        result = forecast(state, steps)
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result.copy()
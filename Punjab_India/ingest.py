@@ -0,0 +1,194 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import loader
+import metrics
+import weather_store
+from aggregation import daily_from_hourly
+from crop_calendar import CALENDARS, kc_matrix
+from irrigation import CROPS, irrigation_frames
+
+# Directory standing in for the Open-Meteo API: one sub-directory per site holding the hourly responses as CSV
+INBOX_DIR = os.getenv('INGEST_INBOX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inbox'))
+
+# Days of observed data kept ahead of the forecast in present_with_forecast ("6 Months Data With Forecast")
+PRESENT_DAYS = 183
+
+
+# Function to get the file holding a site's ingest state
+def _state_path(root, site):
+    return os.path.join(root, '_state', f"{site}.json")
+
+
+# Function to load a site's ingest state: the last complete hour ingested, the modification time of the newest
+# inbox file read and the names of the files read with that time, and the content hash of every day from the
+# watermark on (those days can still change)
+def load_state(root, site):
+    path = _state_path(root, site)
+    if not os.path.exists(path):
+        return {'watermark': None, 'inbox_mtime': 0, 'inbox_files': [], 'day_hashes': {}}
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    state.setdefault('inbox_files', [])
+    state['watermark'] = pd.Timestamp(state['watermark']) if state['watermark'] else None
+    return state
+
+
+# Function to save a site's ingest state, swapping the file in so a crash never leaves half a state
+def save_state(root, site, state):
+    path = _state_path(root, site)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(state, watermark=str(state['watermark']) if state['watermark'] is not None else None), f)
+    os.replace(tmp_path, path)
+
+
+# Function to read the inbox files that arrived since the last run, keeping only hours after the watermark.
+# Files are applied oldest first, so a newer response replaces the hours of an older one. A file with the same
+# modification time as the newest one read last time is still new unless its name was recorded then.
+# Returns the hours with the modification time and file names to record.
+def read_inbox(inbox, site, state):
+    mtimes = {path: os.path.getmtime(path) for path in glob.glob(os.path.join(inbox, site, '*.csv'))}
+    paths = [path for path, mtime in mtimes.items()
+             if mtime > state['inbox_mtime']
+             or (mtime == state['inbox_mtime'] and os.path.basename(path) not in state['inbox_files'])]
+    if not paths:
+        return pd.DataFrame(columns=['time']), state['inbox_mtime'], state['inbox_files']
+    paths.sort(key=lambda path: (mtimes[path], path))
+    hourly = pd.concat([weather_store.single_location(weather_store.read_source_csv(path), path) for path in paths],
+                       ignore_index=True)
+    hourly = hourly.drop_duplicates('time', keep='last').sort_values('time').reset_index(drop=True)
+    if state['watermark'] is not None:
+        hourly = hourly[hourly['time'] > state['watermark']].reset_index(drop=True)
+    newest = mtimes[paths[-1]]
+    files = sorted(os.path.basename(path) for path, mtime in mtimes.items() if mtime == newest)
+    return hourly, newest, files
+
+
+# Function to hash the hourly content of every day, so days whose values did not change can be skipped
+def day_hashes(hourly):
+    row_hashes = pd.util.hash_pandas_object(hourly, index=False).to_numpy()
+    days = hourly['time'].dt.strftime('%Y-%m-%d').to_numpy()
+    return {
+        day: hashlib.sha1(row_hashes[days == day].tobytes()).hexdigest()
+        for day in np.unique(days)
+    }
+
+
+# Function to tell whether every hour of a day (YYYY-MM-DD) is at or before the watermark
+def _is_final(day, watermark):
+    return watermark is not None and pd.Timestamp(day) + pd.Timedelta(hours=23) <= watermark
+
+
+# Function to compute the irrigation rows (with Kc and growth stage) of every crop for some days only
+def irrigation_rows(daily, crops=CROPS):
+    dates = daily['date'].to_numpy(dtype='datetime64[D]')
+    kc = pd.DataFrame(kc_matrix(dates, crops).T, columns=list(crops), index=daily.index)
+    frames = irrigation_frames(daily, kc)
+    for crop, df in frames.items():
+        df['growth_stage'] = CALENDARS[crop].lookup(dates)[1]
+    return frames
+
+
+# Function to get the first day of the forecast window: the present days before the watermark, then the forecast
+def forecast_window_start(watermark, now):
+    return (watermark if watermark is not None else now).normalize() - pd.Timedelta(days=PRESENT_DAYS)
+
+
+# Function to bring one site up to date from its inbox, recomputing only the days the new hours touch.
+# The daily aggregates go to the store (and to the database when conn is given), and so do the irrigation rows.
+# Only days inside the forecast window go to the forecast series, and days that left the window are dropped from it.
+@metrics.instrument('incremental_ingest')
+def refresh_site(site, inbox=INBOX_DIR, root=weather_store.STORE_ROOT, conn=None, now=None, crops=CROPS):
+    state = load_state(root, site)
+    new_hours, inbox_mtime, inbox_files = read_inbox(inbox, site, state)
+    summary = {'site': site, 'new_hours': len(new_hours), 'changed_days': [], 'watermark': state['watermark']}
+    if new_hours.empty:
+        state.update(inbox_mtime=inbox_mtime, inbox_files=inbox_files)
+        save_state(root, site, state)
+        return summary
+
+    # The watermark is the last hour before the first one that is not over yet or misses a value; days up to it
+    # are final. Hours after a gap stay open even if they are complete, so the gap is filled by a later response.
+    previous_watermark = state['watermark']
+    now = pd.Timestamp(now or pd.Timestamp.now()).floor('h')
+    complete = ((new_hours['time'] < now) & new_hours.notna().all(axis=1)).cummin()
+    if complete.any():
+        state['watermark'] = new_hours.loc[complete, 'time'].iloc[-1]
+
+    # Days the new hours fall in, plus stored days that became final in this run (they move to the historical
+    # series even if their values did not change), completed with the hours of those days already in the store
+    days = set(new_hours['time'].dt.strftime('%Y-%m-%d'))
+    newly_final = {day for day in days | set(state['day_hashes'])
+                   if _is_final(day, state['watermark']) and not _is_final(day, previous_watermark)}
+    days |= newly_final
+    stored = weather_store.read(root, 'hourly', site, start=min(days), end=max(days))
+    if not stored.empty:
+        stored = stored[stored['time'].dt.strftime('%Y-%m-%d').isin(days)]
+    hourly = pd.concat([stored, new_hours], ignore_index=True) if not stored.empty else new_hours
+    hourly = hourly.drop_duplicates('time', keep='last').sort_values('time').reset_index(drop=True)
+
+    hashes = day_hashes(hourly)
+    changed = {day for day, digest in hashes.items() if state['day_hashes'].get(day) != digest}
+    final = {day for day in hashes if _is_final(day, state['watermark'])}
+    recompute = sorted(changed | newly_final)
+
+    if recompute:
+        recompute_hours = hourly[hourly['time'].dt.strftime('%Y-%m-%d').isin(recompute)]
+        weather_store.upsert(recompute_hours, root, 'hourly', site)
+        daily = daily_from_hourly(recompute_hours)
+        observed = daily[daily['date'].dt.strftime('%Y-%m-%d').isin(final)]
+
+        window_start = forecast_window_start(state['watermark'], now)
+        forecast_days = daily[daily['date'] >= window_start]
+        if not forecast_days.empty:
+            weather_store.upsert(forecast_days, root, 'forecast', site)
+        weather_store.trim(root, 'forecast', site, window_start)
+        if not observed.empty:
+            weather_store.upsert(observed, root, 'daily', site)
+        frames = irrigation_rows(daily, crops)
+
+        if conn is not None:
+            if not forecast_days.empty:
+                loader.load_forecast(conn, forecast_days, mode='upsert', keep_from=window_start.date())
+            if not observed.empty:
+                loader.load_historical(conn, observed)
+            for crop, df in frames.items():
+                loader.load_irrigation_schedule(conn, df, crop, site)
+
+    # Hashes of days before the watermark's day are no longer needed: no new hours can reach them
+    first_open_day = state['watermark'].strftime('%Y-%m-%d') if state['watermark'] is not None else ''
+    state['day_hashes'] = {day: digest for day, digest in {**state['day_hashes'], **hashes}.items()
+                           if day >= first_open_day}
+    state.update(inbox_mtime=inbox_mtime, inbox_files=inbox_files)
+    save_state(root, site, state)
+    summary.update(changed_days=recompute, watermark=state['watermark'])
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingest new hourly data for every site in the inbox')
+    parser.add_argument('--inbox', default=INBOX_DIR, help='Directory with one sub-directory of CSV responses per site')
+    parser.add_argument('--root', default=weather_store.STORE_ROOT, help='Store directory')
+    parser.add_argument('--sites', nargs='+', help='Sites to refresh (defaults to every site in the inbox)')
+    parser.add_argument('--db', action='store_true', help='Also upsert the changed days into PostgreSQL')
+    args = parser.parse_args()
+
+    sites = args.sites or sorted(name for name in os.listdir(args.inbox) if os.path.isdir(os.path.join(args.inbox, name)))
+    conn = loader.get_connection() if args.db else None
+    try:
+        for site in sites:
+            summary = refresh_site(site, args.inbox, args.root, conn)
+            print(f"{site}: {summary['new_hours']} new hour(s), {len(summary['changed_days'])} changed day(s), "
+                  f"watermark {summary['watermark']}")
+    finally:
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+
+CROPS = ['Wheat', 'Rice', 'Maize', 'Sugarcane', 'Cotton', 'Barley', 'Potatoes', 'Pulses']
+
+# Daily weather variables the irrigation engine takes, in the order of compute_irrigation's arguments
+WEATHER_VARIABLES = ['ET₀ (mm)', 'precipitation (mm)', 'soil_moisture_28_to_100cm (m³/m³)']
+
+# Soil moisture threshold in m³/m³ (mean soil moisture of the 2020-2023 dataset)
+THRESHOLD_SOIL_MOISTURE = 0.267997
+
+# Field application efficiency used to turn net into gross irrigation requirement
+IRRIGATION_EFFICIENCY = 0.70
+
+# Water used per growing season by traditional flood irrigation (mid-range of 2020-2023 studies for
+# central Punjab, adjusted for its 50% efficiency), the baseline smart irrigation is compared against
+TRADITIONAL_IRRIGATION_MM = {
+    'Wheat': 950, 'Rice': 3500, 'Maize': 1400, 'Sugarcane': 4000,
+    'Cotton': 1600, 'Barley': 750, 'Potatoes': 1200, 'Pulses': 700
+}
+
+# 1 mm of water over one hectare is 10,000 litres
+LITRES_PER_MM_HECTARE = 10000
+
+
+# Function to shape a scalar or per-crop parameter so it broadcasts against a (crop, ..., day) array
+def _per_crop(value, ndim):
+    value = np.asarray(value, dtype=float)
+    if value.ndim == 0:
+        return value
+    return value.reshape((-1,) + (1,) * (ndim - 1))
+
+
+# Function to compute the irrigation quantities for every crop and day in one array operation.
+# Weather arrays have shape (..., day); kc has shape (crop, ..., day).
+# threshold and efficiency may be scalars or one value per crop.
+@metrics.instrument('irrigation')
+def compute_irrigation(et0, precipitation, soil_moisture, kc,
+                       threshold=THRESHOLD_SOIL_MOISTURE, efficiency=IRRIGATION_EFFICIENCY):
+    kc = np.asarray(kc, dtype=float)
+    et0 = np.asarray(et0, dtype=float)
+    precipitation = np.asarray(precipitation, dtype=float)
+    soil_moisture = np.asarray(soil_moisture, dtype=float)
+    threshold = _per_crop(threshold, kc.ndim)
+    efficiency = _per_crop(efficiency, kc.ndim)
+
+    etc = et0 * kc
+    soil_deficit = etc - precipitation
+    irrigation_need = soil_moisture < threshold
+    irrigation_amount = np.where(irrigation_need, np.maximum(0, threshold - soil_moisture + soil_deficit), 0).round(2)
+
+    return {
+        'etc': etc,
+        'soil_deficit': soil_deficit,
+        'irrigation_need': np.broadcast_to(irrigation_need, kc.shape),
+        'irrigation_amount': irrigation_amount,
+        'irrigation_amount_per_hectare': (irrigation_amount * LITRES_PER_MM_HECTARE).round(2),
+        'gir': irrigation_amount / efficiency
+    }
+
+
+# Function to build the per-crop irrigation frames (same columns as the notebook) from daily weather.
+# kc is a DataFrame with one column per crop aligned with the rows of daily.
+def irrigation_frames(daily, kc, threshold=THRESHOLD_SOIL_MOISTURE, efficiency=IRRIGATION_EFFICIENCY):
+    crops = list(kc.columns)
+    result = compute_irrigation(
+        daily['ET₀ (mm)'].to_numpy(),
+        daily['precipitation (mm)'].to_numpy(),
+        daily['soil_moisture_28_to_100cm (m³/m³)'].to_numpy(),
+        kc.to_numpy().T,
+        threshold=threshold,
+        efficiency=efficiency
+    )
+    efficiency = np.broadcast_to(_per_crop(efficiency, 1), (len(crops),))
+
+    frames = {}
+    for i, crop in enumerate(crops):
+        df = daily.copy()
+        df['crop'] = crop
+        df['Kc'] = kc[crop].to_numpy()
+        df['ETc (mm)'] = result['etc'][i]
+        df['soil_deficit(mm)'] = result['soil_deficit'][i]
+        df['irrigation_need'] = result['irrigation_need'][i]
+        df['irrigation_amount(mm)'] = result['irrigation_amount'][i]
+        df['irrigation_amount_per_hectare(liters)'] = result['irrigation_amount_per_hectare'][i]
+        df['irrigation_efficiency'] = efficiency[i]
+        df['GIR'] = result['gir'][i]
+        frames[crop] = df
+    return frames
+
+
+# Function to cut an irrigation frame down to the days of a growing season that need water
+def irrigation_schedule(df, start, end):
+    season = df[(df['date'] >= pd.Timestamp(start)) & (df['date'] <= pd.Timestamp(end)) & (df['irrigation_amount(mm)'] > 0)]
+    columns = ['date', 'irrigation_amount(mm)', 'irrigation_amount_per_hectare(liters)', 'growth_stage', 'GIR']
+    return season[[column for column in columns if column in season.columns]].reset_index(drop=True)
@@ -0,0 +1,133 @@
+import http.client
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import api
+import data_access
+from benchmark import synthetic_hourly
+from crop_calendar import CALENDARS, kc_matrix
+from irrigation import CROPS, TRADITIONAL_IRRIGATION_MM, irrigation_frames
+from schema import IRRIGATION_COLUMNS, WEATHER_COLUMNS
+
+# Requests each client sends in a round; a few distinct queries, mostly repeated as dashboards and notifiers do
+REQUEST_MIX = [
+    ('/api/historical?columns=temperature_2m_c,precipitation_mm&start={start}&end={end}', {}),
+    ('/api/historical?columns=temperature_2m_c,precipitation_mm&start={start}&end={end}', {'Accept-Encoding': 'gzip'}),
+    ('/api/forecast?start={end}', {'Accept': api.ARROW_CONTENT_TYPE}),
+    ('/api/irrigation?crop=Wheat,Rice&start={start}&end={end}', {'Accept-Encoding': 'gzip'}),
+    ('/api/crops', {})
+]
+
+
+# Function to fill a SQLite database standing in for PostgreSQL with the tables the API serves
+def build_database(path, years, site=api.WEATHER_SITE):
+    hourly_path = os.path.join(os.path.dirname(path), 'hourly.csv')
+    synthetic_hourly(years).to_csv(hourly_path, index=False)
+    daily = aggregation.aggregate_daily(hourly_path)
+
+    engine = data_access.get_engine(f"sqlite:///{path}")
+    # Dates are stored as ISO date strings, as PostgreSQL's date type compares, so an end date includes its day
+    weather = daily[list(WEATHER_COLUMNS)].rename(columns=WEATHER_COLUMNS)
+    weather['date'] = weather['date'].dt.date
+    weather.to_sql('historical_data', engine, if_exists='replace', index=False, chunksize=10000)
+    weather.tail(16).to_sql('present_with_forecast', engine, if_exists='replace', index=False)
+
+    dates = daily['date'].to_numpy(dtype='datetime64[D]')
+    kc = pd.DataFrame(kc_matrix(dates, CROPS).T, columns=list(CROPS), index=daily.index)
+    schedules = []
+    for crop, df in irrigation_frames(daily, kc).items():
+        df['growth_stage'] = CALENDARS[crop].lookup(dates)[1]
+        df = df[list(IRRIGATION_COLUMNS)].rename(columns=IRRIGATION_COLUMNS)
+        schedules.append(df.assign(site=site, crop=crop, date=df['date'].dt.date))
+    pd.concat(schedules, ignore_index=True).to_sql('irrigation_need', engine, if_exists='replace', index=False,
+                                                   chunksize=10000)
+    with engine.begin() as conn:
+        conn.exec_driver_sql('CREATE UNIQUE INDEX irrigation_need_key ON irrigation_need (site, crop, date)')
+        conn.exec_driver_sql('CREATE INDEX historical_data_date_idx ON historical_data (date)')
+
+    pd.DataFrame({
+        'crop': list(CROPS),
+        'sowing_day': [CALENDARS[crop].sowing for crop in CROPS],
+        'season_days': [CALENDARS[crop].season_days() for crop in CROPS],
+        'traditional_irrigation_mm': [TRADITIONAL_IRRIGATION_MM[crop] for crop in CROPS]
+    }).to_sql('crop_parameters', engine, if_exists='replace', index=False)
+    return engine, daily['date'].min(), daily['date'].max()
+
+
+# Function to send requests over one keep-alive connection until the deadline, returning the latencies and statuses
+def _client(port, paths, deadline, etags):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    latencies, statuses = [], []
+    i = 0
+    while time.perf_counter() < deadline:
+        path, headers = paths[i % len(paths)]
+        headers = dict(headers)
+        # Every other round revalidates with the ETag from the previous response
+        if (i // len(paths)) % 2 and path in etags:
+            headers['If-None-Match'] = etags[path]
+        started = time.perf_counter()
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status)
+        if response.getheader('ETag'):
+            etags[path] = response.getheader('ETag')
+        i += 1
+    conn.close()
+    return latencies, statuses
+
+
+# Function to load the API with concurrent clients for some seconds and report throughput and latency percentiles
+def run(clients, seconds, years):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, first, last = build_database(os.path.join(tmp, 'api.db'), years)
+        start = (last - pd.Timedelta(days=365)).date()
+        paths = [(path.format(start=start, end=last.date()), headers) for path, headers in REQUEST_MIX]
+
+        server = api.make_server(engine, '127.0.0.1', 0)
+        api.start(server)
+        port = server.server_address[1]
+        try:
+            deadline = time.perf_counter() + seconds
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                futures = [pool.submit(_client, port, paths[i % len(paths):] + paths[:i % len(paths)], deadline, {})
+                           for i in range(clients)]
+                results = [future.result() for future in futures]
+        finally:
+            server.shutdown()
+            server.server_close()
+            engine.dispose()
+            data_access.invalidate()
+
+    latencies = np.concatenate([latency for latency, _ in results]) * 1000
+    statuses = pd.Series(np.concatenate([status for _, status in results])).value_counts().sort_index()
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / seconds,
+        'p50_ms': np.percentile(latencies, 50),
+        'p95_ms': np.percentile(latencies, 95),
+        'p99_ms': np.percentile(latencies, 99),
+        'statuses': statuses.to_dict()
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load test the HTTP API against a local SQLite database')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent keep-alive clients')
+    parser.add_argument('--seconds', type=float, default=10, help='How long to send requests for')
+    parser.add_argument('--years', type=int, default=4, help='Years of synthetic data in the database')
+    args = parser.parse_args()
+
+    report = run(args.clients, args.seconds, args.years)
+    print(f"{report['requests']} requests in {args.seconds:.0f} s: {report['requests_per_second']:.0f} req/s")
+    print(f"latency p50 {report['p50_ms']:.2f} ms, p95 {report['p95_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms")
+    print('statuses: ' + ', '.join(f"{status}: {count}" for status, count in report['statuses'].items()))
@@ -0,0 +1,251 @@
+import io
+import os
+
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+import data_access
+import rollups
+from crop_calendar import CALENDARS
+from irrigation import CROPS, TRADITIONAL_IRRIGATION_MM
+from schema import CROP_DETAIL_COLUMNS, IRRIGATION_COLUMNS, WEATHER_COLUMNS
+
+# Rows sent per COPY batch
+BATCH_SIZE = 50000
+
+# Site the irrigation schedules are loaded for when none is given
+SITE = os.getenv('WEATHER_SITE', 'punjab_2')
+
+WEATHER_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    date DATE PRIMARY KEY,
+    temperature_2m_c DECIMAL,
+    relative_humidity_2m DECIMAL,
+    precipitation_mm DECIMAL,
+    et₀_mm DECIMAL,
+    wind_speed_10m_kmh DECIMAL,
+    soil_temperature_28_to_100cm_c DECIMAL,
+    soil_moisture_28_to_100cm_m3m3 DECIMAL,
+    shortwave_radiation_instant_wm2 DECIMAL
+)
+'''
+
+# Irrigation need of every site and crop in one table, partitioned by season (see season_partitions)
+IRRIGATION_NEED_SQL = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    site VARCHAR NOT NULL,
+    crop VARCHAR NOT NULL,
+    date DATE NOT NULL,
+    irrigation_amount_mm DECIMAL,
+    irrigation_amount_per_hectare_litre DECIMAL,
+    growth_stage VARCHAR,
+    PRIMARY KEY (site, crop, date)
+) PARTITION BY RANGE (date);
+CREATE INDEX IF NOT EXISTS {table}_date_crop_idx ON {table} (date, crop);
+'''
+
+CROP_PARAMETERS_SQL = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    crop VARCHAR PRIMARY KEY,
+    sowing_season VARCHAR,
+    harvesting_season VARCHAR,
+    duration_days VARCHAR,
+    kc_initial DECIMAL,
+    kc_development DECIMAL,
+    kc_mid_season DECIMAL,
+    kc_late_season DECIMAL,
+    sowing_day CHAR(5),
+    season_days INTEGER,
+    traditional_irrigation_mm DECIMAL
+)
+'''
+
+
+# Function to open a database connection using the DATABASE_URL environment variable
+def get_connection():
+    load_dotenv()
+    return psycopg2.connect(os.getenv('DATABASE_URL'), sslmode=os.getenv('DB_SSLMODE', 'require'))
+
+
+# Function to stream a dataframe into a table with COPY, one batch at a time
+def copy_frame(cur, df, table):
+    columns = ', '.join(df.columns)
+    sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(df), BATCH_SIZE):
+        buffer = io.StringIO()
+        df.iloc[start:start + BATCH_SIZE].to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cur.copy_expert(sql, buffer)
+
+
+# Function to load a dataframe into a table through a staging table.
+# mode='upsert' merges rows by key; mode='replace' swaps in a freshly loaded table in one transaction.
+# refresh(cur, first, last) updates the table's rollups in the same transaction, for the loaded days
+# (first and last are None after a replace, when every period is recomputed).
+def load_frame(conn, df, table, create_sql, key='date', mode='upsert', refresh=None):
+    if mode not in ('upsert', 'replace'):
+        raise ValueError(f"Unknown load mode: {mode}")
+    keys = [key] if isinstance(key, str) else list(key)
+    table = table.lower()
+    staging = f"{table}_staging"
+    try:
+        with conn.cursor() as cur:
+            cur.execute(create_sql.format(table=table))
+            cur.execute(f"DROP TABLE IF EXISTS {staging}")
+            cur.execute(f"CREATE TABLE {staging} (LIKE {table} INCLUDING ALL)")
+            copy_frame(cur, df, staging)
+
+            if mode == 'upsert':
+                columns = list(df.columns)
+                updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns if column not in keys)
+                cur.execute(f'''
+                    INSERT INTO {table} ({', '.join(columns)})
+                    SELECT {', '.join(columns)} FROM {staging}
+                    ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}
+                ''')
+                cur.execute(f"DROP TABLE {staging}")
+            else:
+                # DDL is transactional in PostgreSQL, so readers see either the old table or the new one
+                cur.execute(f"DROP TABLE {table}")
+                cur.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+
+            if refresh is not None:
+                if mode == 'upsert' and not df.empty:
+                    refresh(cur, df['date'].min(), df['date'].max())
+                elif mode == 'replace':
+                    refresh(cur, None, None)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    data_access.invalidate([table, 'weather_rollup', 'irrigation_rollup'] if refresh else [table])
+
+
+# Function to rename a notebook dataframe to the database columns
+def to_table_columns(df, mapping):
+    df = df.reset_index() if 'date' not in df.columns else df
+    df = df[list(mapping)].rename(columns=mapping)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    return df
+
+
+# Function to load the daily historical weather data
+def load_historical(conn, df, mode='upsert'):
+    load_frame(conn, to_table_columns(df, WEATHER_COLUMNS), 'Historical_Data', WEATHER_TABLE_SQL, mode=mode,
+               refresh=lambda cur, first, last: rollups.refresh_weather(cur, 'historical_data', first, last))
+
+
+# Function to load the present data with the forecast appended, replacing the previous refresh.
+# keep_from drops the rows before that day in the same transaction, so upserts keep the table to the forecast window.
+def load_forecast(conn, df, mode='replace', keep_from=None):
+    def refresh(cur, first, last):
+        if keep_from is not None:
+            cur.execute("SELECT min(date) FROM present_with_forecast")
+            oldest = cur.fetchone()[0]
+            cur.execute("DELETE FROM present_with_forecast WHERE date < %s", (keep_from,))
+            # The rollup periods of the dropped days are recomputed too
+            if oldest is not None and first is not None:
+                first = min(first, oldest)
+        rollups.refresh_weather(cur, 'present_with_forecast', first, last)
+
+    load_frame(conn, to_table_columns(df, WEATHER_COLUMNS), 'Present_with_forecast', WEATHER_TABLE_SQL, mode=mode,
+               refresh=refresh)
+
+
+# Function to list the season partitions covering the days first..last as (name, first day, day after the last).
+# Kharif runs from April to September and Rabi from October to March, as in the rollups.
+def season_partitions(first, last):
+    partitions = []
+    for year in range(pd.Timestamp(first).year - 1, pd.Timestamp(last).year + 1):
+        for name, start, end in (
+            (f"irrigation_need_{year}_kharif", f"{year}-04-01", f"{year}-10-01"),
+            (f"irrigation_need_{year}_rabi", f"{year}-10-01", f"{year + 1}-04-01")
+        ):
+            if pd.Timestamp(end) > pd.Timestamp(first) and pd.Timestamp(start) <= pd.Timestamp(last):
+                partitions.append((name, start, end))
+    return partitions
+
+
+# Function to create the irrigation_need table and the season partitions a load is about to write to
+def ensure_partitions(conn, first, last):
+    try:
+        with conn.cursor() as cur:
+            cur.execute(IRRIGATION_NEED_SQL.format(table='irrigation_need'))
+            for name, start, end in season_partitions(first, last):
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF irrigation_need "
+                            f"FOR VALUES FROM ('{start}') TO ('{end}')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# Function to load the irrigation schedule of one crop at one site
+def load_irrigation_schedule(conn, df, crop, site=SITE):
+    df = to_table_columns(df, IRRIGATION_COLUMNS)
+    if df.empty:
+        return
+    df.insert(0, 'crop', crop)
+    df.insert(0, 'site', site)
+    ensure_partitions(conn, df['date'].min(), df['date'].max())
+    load_frame(conn, df, 'irrigation_need', IRRIGATION_NEED_SQL, key=('site', 'crop', 'date'),
+               refresh=lambda cur, first, last: rollups.refresh_irrigation(cur, crop, first, last, site))
+
+
+# Function to load the crop parameters, one row per crop with the notebook's crop details columns.
+# The sowing day, season length and traditional water use are filled in from the crop calendar.
+def load_crop_parameters(conn, df):
+    df = df[['crop'] + list(CROP_DETAIL_COLUMNS)].rename(columns=CROP_DETAIL_COLUMNS)
+    df['sowing_day'] = df['crop'].map(lambda crop: CALENDARS[crop].sowing)
+    df['season_days'] = df['crop'].map(lambda crop: CALENDARS[crop].season_days())
+    df['traditional_irrigation_mm'] = df['crop'].map(TRADITIONAL_IRRIGATION_MM)
+    load_frame(conn, df, 'crop_parameters', CROP_PARAMETERS_SQL, key='crop')
+
+
+# Function to copy the per-crop tables ({crop}_irrigation_need and {crop}_data) into the long-format tables
+def migrate_legacy(conn, site=SITE):
+    details = []
+    with conn.cursor() as cur:
+        for crop in CROPS:
+            cur.execute("SELECT to_regclass(%s)", (f"{crop.lower()}_data",))
+            if cur.fetchone()[0] is not None:
+                cur.execute(f"SELECT {', '.join(CROP_DETAIL_COLUMNS.values())} FROM {crop.lower()}_data ORDER BY id LIMIT 1")
+                row = cur.fetchone()
+                if row is not None:
+                    details.append(dict(zip(CROP_DETAIL_COLUMNS, row), crop=crop))
+    if details:
+        load_crop_parameters(conn, pd.DataFrame(details))
+
+    for crop in CROPS:
+        table = f"{crop.lower()}_irrigation_need"
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            if cur.fetchone()[0] is None:
+                continue
+            df = pd.read_sql_query(f"SELECT date, irrigation_amount_mm, irrigation_amount_per_hectare_litre, "
+                                   f"growth_stage FROM {table}", conn)
+        load_irrigation_schedule(conn, df.rename(columns={v: k for k, v in IRRIGATION_COLUMNS.items()}), crop, site)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load the present data with forecast into PostgreSQL')
+    parser.add_argument('csv', nargs='?', help='Daily CSV written by the forecasting notebook')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Copy the per-crop tables into irrigation_need and crop_parameters')
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        if args.migrate:
+            migrate_legacy(conn)
+            print("Migrated the per-crop tables into irrigation_need and crop_parameters.")
+        if args.csv:
+            forecast = pd.read_csv(args.csv, index_col=0, parse_dates=True)
+            forecast.index.name = 'date'
+            load_forecast(conn, forecast)
+            print(f"Loaded {len(forecast)} rows into Present_with_forecast.")
+    finally:
+        conn.close()
@@ -1,14 +1,52 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
-from sqlalchemy import create_engine
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
 import plotly.graph_objects as go
 
+import alerts
+import data_access
+import metrics
+import series
+
+# Optional columnar weather store the charts read from instead of the database
+WEATHER_STORE = os.getenv('WEATHER_STORE')
+WEATHER_SITE = os.getenv('WEATHER_SITE', 'punjab_2')
+
 # Initialize session state for page navigation and feature selection
 if 'page' not in st.session_state:
     st.session_state.page = 0
 if 'feature_selected' not in st.session_state:
     st.session_state.feature_selected = 'temperature_2m_c'  # Default feature selection
 
+# Function to get the thread pool the page's queries run on, shared by all sessions and sized to every connection
+# the engine can open (pool plus overflow), so concurrent sessions do not queue behind each other's fetches
+@st.cache_resource
+def get_fetch_pool():
+    return ThreadPoolExecutor(max_workers=data_access.POOL_SIZE + data_access.MAX_OVERFLOW, thread_name_prefix='fetch')
+
+# Function to run independent fetches at once; each keeps this run's Streamlit context and metrics session log
+def fetch_all(*calls):
+    script_ctx = get_script_run_ctx()
+
+    def run(context, call):
+        add_script_run_ctx(threading.current_thread(), script_ctx)
+        return context.run(call)
+
+    futures = [get_fetch_pool().submit(run, contextvars.copy_context(), call) for call in calls]
+    return [future.result() for future in futures]
+
+# Function to show a (level, text) message returned by a fetcher. Fetchers run on pool threads and never call
+# st themselves, so every message is drawn from the script thread in a fixed place.
+def show_message(message, container=st):
+    if message is not None:
+        level, text = message
+        getattr(container, level)(text)
+
 # Function to move to the next page
 def next_page():
     st.session_state.page += 1
@@ -21,49 +59,92 @@ def prev_page():
 def get_connection():
     try:
         DATABASE_URL = st.secrets["DATABASE_URL"]
-        engine = create_engine(DATABASE_URL)
+        engine = data_access.get_engine(DATABASE_URL)
         return engine
     except KeyError:
         st.error("Database URL not found. Please set it in Streamlit secrets.")
         return None
 
-# Function to fetch historical data for a specific feature
-def get_historical_data(engine, feature):
-    query = f"SELECT date, {feature} FROM Historical_Data;"
+# Function to fetch historical data for a specific feature, downsampled for charting, or as the loader's
+# weekly means when overview is set. Returns the data and a message to show (or None).
+@metrics.instrument('get_historical_data')
+def get_historical_data(engine, feature, start=None, end=None, overview=False):
     try:
-        df = pd.read_sql_query(query, engine)
+        if overview:
+            df, message = get_rollup_series(engine, 'Historical_Data', feature)
+            if not df.empty:
+                return df, message
+        df = series.fetch_series(engine, 'Historical_Data', feature, start=start, end=end,
+                                 store_root=WEATHER_STORE, site=WEATHER_SITE)
         if df.empty:
-            st.warning(f"No historical data found for feature: {feature}")
-        return df
+            return df, ('warning', f"No historical data found for feature: {feature}")
+        return df, None
     except Exception as e:
-        st.error(f"Error fetching historical data: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), ('error', f"Error fetching historical data: {str(e)}")
 
-# Function to fetch future data for a specific feature
-def get_future_data(engine, feature):
-    query = f"SELECT date, {feature} FROM Present_with_forecast;"
+# Function to fetch future data for a specific feature, downsampled for charting.
+# Returns the data and a message to show (or None).
+@metrics.instrument('get_future_data')
+def get_future_data(engine, feature, start=None, end=None):
     try:
-        df = pd.read_sql_query(query, engine)
+        df = series.fetch_series(engine, 'Present_with_forecast', feature, start=start, end=end,
+                                 store_root=WEATHER_STORE, site=WEATHER_SITE)
         if df.empty:
-            st.warning(f"No future data found for feature: {feature}")
-        return df
+            return df, ('warning', f"No future data found for feature: {feature}")
+        return df, None
     except Exception as e:
-        st.error(f"Error fetching future data: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), ('error', f"Error fetching future data: {str(e)}")
+
+# Function to tell whether a chart shows the rollup instead of the daily rows: unzoomed, read from the database
+# (the weather store has no rollups) and spanning more than ROLLUP_MIN_DAYS
+def use_rollup(date_range, start):
+    first_date, last_date = date_range
+    return (WEATHER_STORE is None and start is None and first_date is not None
+            and last_date - first_date > pd.Timedelta(days=series.ROLLUP_MIN_DAYS))
+
+# Function to fetch a weather series as the weekly means kept by the loader, or an empty frame if the rollups
+# cannot be read (they only exist once the loader has run). Returns the data and a message to show.
+def get_rollup_series(engine, table, feature):
+    try:
+        df = series.fetch_rollup_series(engine, table, feature)
+    except Exception:
+        return pd.DataFrame(), None
+    return df, ('info', f"Showing {series.ROLLUP_PERIOD}ly means. Zoom to a window of dates for daily values.")
 
-# Function to fetch irrigation needs data for a specific crop
+# Function to fetch irrigation needs data for a specific crop. Returns the data and a message to show (or None).
+@metrics.instrument('get_irrigation_needs')
 def get_irrigation_needs(engine, crop):
-    query = f"SELECT * FROM {crop.lower()}_irrigation_need;"
     try:
-        df = pd.read_sql_query(query, engine)
+        df = data_access.fetch_irrigation_need(engine, [crop], [WEATHER_SITE])
+        df = df.drop(columns=['site', 'crop'])
         if df.empty:
-            st.warning(f"No irrigation needs data found for crop: {crop}")
-        return df
+            return df, ('warning', f"No irrigation needs data found for crop: {crop}")
+        return df, None
     except Exception as e:
-        st.error(f"Error fetching irrigation needs data: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), ('error', f"Error fetching irrigation needs data: {str(e)}")
+
+# Function to fetch the first and last date of a weather table, or (None, None) if it cannot be read
+def get_date_range(engine, table):
+    try:
+        return series.date_range(engine, table, WEATHER_STORE, WEATHER_SITE)
+    except Exception:
+        return None, None
+
+# Function to let the user zoom a chart to a date window; finer detail is fetched for that window only
+def select_date_window(date_range, key):
+    first_date, last_date = date_range
+    if first_date is None:
+        return None, None
+
+    window = st.date_input('Zoom to dates', value=(first_date.date(), last_date.date()),
+                           min_value=first_date.date(), max_value=last_date.date(), key=key)
+    # Wait until both ends of the range are picked; the full range shares the unzoomed cache entry
+    if len(window) != 2 or (window[0] == first_date.date() and window[1] == last_date.date()):
+        return None, None
+    return window[0], window[1]
 
 # Function to create a line chart for irrigation needs
+@metrics.instrument('chart_irrigation_needs')
 def plot_irrigation_needs(data, crop):
     if 'date' not in data.columns or 'irrigation_amount_mm' not in data.columns:
         st.error("The required columns 'date' and 'irrigation_amount_mm' are not present in the data.")
@@ -74,20 +155,71 @@ def plot_irrigation_needs(data, crop):
     fig.update_layout(title=f'Irrigation Needs Over Time for {crop}', xaxis_title='Date', yaxis_title='Irrigation Amount (mm)', template='plotly_white')
     return fig
 
-# Function to fetch crop details
+# Function to fetch a crop's water use per growing season from the rollups kept by the loader
+@metrics.instrument('get_season_water_usage')
+def get_season_water_usage(engine, crop):
+    try:
+        df = data_access.fetch_irrigation_totals(engine, crop, WEATHER_SITE, 'crop_season')
+        return df.rename(columns={
+            'period_start': 'Season start',
+            'irrigation_amount_mm': 'Net irrigation (mm)',
+            'gross_irrigation_mm': 'Gross irrigation (mm)',
+            'irrigation_amount_per_hectare_litre': 'Water per hectare (litres)',
+            'irrigation_days': 'Irrigation days'
+        })
+    except Exception:
+        # The rollups only exist once the loader has run
+        return pd.DataFrame()
+
+# Function to read the alerts queued for a crop by the alert generator for today and tomorrow
+@metrics.instrument('get_irrigation_alerts')
+def get_irrigation_alerts(crop):
+    today = pd.Timestamp('today').normalize()
+    try:
+        outbox = data_access.get_engine(f"sqlite:///{alerts.OUTBOX}")
+        df = data_access.fetch_table(outbox, 'irrigation_alerts', ['id', 'horizon', 'site', 'crop', 'date', 'irrigation_needed', 'message'],
+                                     today.strftime('%Y-%m-%d'), (today + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    except Exception:
+        # Nothing has been queued yet
+        return pd.DataFrame()
+    df = df[(df['horizon'] == 'daily') & (df['site'] == WEATHER_SITE) & (df['crop'] == crop)]
+    # Keep the latest alert per day when the amount was revised
+    return df.sort_values('id').drop_duplicates('date', keep='last').sort_values('date')
+
+# Function to compare smart and traditional irrigation water use for every crop over one season, in one query
+@metrics.instrument('get_season_comparison')
+def get_season_comparison(engine, season_year):
+    try:
+        df = data_access.fetch_season_comparison(engine, season_year, WEATHER_SITE)
+    except Exception as e:
+        st.error(f"Error fetching season comparison: {str(e)}")
+        return pd.DataFrame()
+    df = df.rename(columns={
+        'crop': 'Crop',
+        'traditional_irrigation_mm': 'Traditional Irrigation (mm)',
+        'smart_irrigation_mm': 'Smart Irrigation (mm)'
+    })
+    df['Water Saved (mm)'] = df['Traditional Irrigation (mm)'] - df['Smart Irrigation (mm)']
+    df['Percentage Saved (%)'] = (df['Water Saved (mm)'] / df['Traditional Irrigation (mm)'] * 100).round(2)
+    return df
+
+# Function to fetch crop details. Returns the data and a message to show (or None).
+@metrics.instrument('get_crop_details')
 def get_crop_details(engine, crop):
-    query = f"SELECT * FROM {crop.lower()}_data;"
     try:
-        df = pd.read_sql_query(query, engine)
+        df = data_access.fetch_crop_parameters(engine, [crop])
         if df.empty:
-            st.warning(f"No details found for crop: {crop}")
-        return df
+            return df, ('warning', f"No details found for crop: {crop}")
+        return df, None
     except Exception as e:
-        st.error(f"Error fetching crop details: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), ('error', f"Error fetching crop details: {str(e)}")
 
-# Function to visualize historical and future data
+# Function to visualize historical and future data.
+# Runs as a fragment, so changing the feature or a zoom window reruns only this view.
+@st.fragment
 def visualize_data(engine, feature_selected):
+    # A fragment rerun is a run of its own: collect and show only its timings
+    metrics.start_session_log()
     st.header('Historical and Future Data')
 
     st.subheader('Select Feature for Data Visualization')
@@ -101,71 +233,160 @@ def visualize_data(engine, feature_selected):
         'soil_moisture_28_to_100cm_m3m3', 'shortwave_radiation_instant_wm2'
     ]) if f == st.session_state.feature_selected][0])
 
+    historical_range, future_range = fetch_all(
+        lambda: get_date_range(engine, 'Historical_Data'),
+        lambda: get_date_range(engine, 'Present_with_forecast')
+    )
+
+    # Lay out both sections with their zoom windows first, so both series can be fetched at once
     st.subheader('4 Years Historical Data')
-    historical_data = get_historical_data(engine, st.session_state.feature_selected)
+    historical_start, historical_end = select_date_window(historical_range, 'historical_window')
+    historical_section = st.container()
+    st.subheader('6 Months Data With Forecast')
+    future_start, future_end = select_date_window(future_range, 'future_window')
+    future_section = st.container()
+
+    (historical_data, historical_message), (future_data, future_message) = fetch_all(
+        lambda: get_historical_data(engine, st.session_state.feature_selected, historical_start, historical_end,
+                                    use_rollup(historical_range, historical_start)),
+        lambda: get_future_data(engine, st.session_state.feature_selected, future_start, future_end)
+    )
+    show_message(historical_message, historical_section)
+    show_message(future_message, future_section)
+
     if not historical_data.empty:
         # Check for duplicate dates
         if historical_data.duplicated(subset='date').any():
-            st.warning("Duplicate dates found in historical data.")
-
-        # Ensure the date column is datetime type
-        historical_data['date'] = pd.to_datetime(historical_data['date'])
-
-        # Sort data by date
-        historical_data = historical_data.sort_values(by='date')
-
-        # Plot the historical data
-        fig_hist = go.Figure()
-        fig_hist.add_trace(go.Scatter(x=historical_data['date'], y=historical_data[st.session_state.feature_selected],
-                                      mode='lines',
-                                      name=f'Historical {st.session_state.feature_selected}'))
-        fig_hist.update_layout(
-            title=f'Historical {st.session_state.feature_selected}',
-            xaxis_title='Date',
-            yaxis_title=st.session_state.feature_selected,
-            template='plotly_white'
-        )
-        st.plotly_chart(fig_hist)
+            historical_section.warning("Duplicate dates found in historical data.")
+
+        # Plot the historical data (dates arrive parsed and sorted from the query)
+        with metrics.timer('chart_historical') as chart:
+            fig_hist = go.Figure()
+            fig_hist.add_trace(go.Scatter(x=historical_data['date'], y=historical_data[st.session_state.feature_selected],
+                                          mode='lines',
+                                          name=f'Historical {st.session_state.feature_selected}'))
+            fig_hist.update_layout(
+                title=f'Historical {st.session_state.feature_selected}',
+                xaxis_title='Date',
+                yaxis_title=st.session_state.feature_selected,
+                template='plotly_white'
+            )
+            chart.result = fig_hist
+        historical_section.plotly_chart(fig_hist)
 
-    st.subheader('6 Months Data With Forecast')
-    future_data = get_future_data(engine, st.session_state.feature_selected)
     if not future_data.empty:
-        # Ensure the date column is datetime type
-        future_data['date'] = pd.to_datetime(future_data['date'])
-
-        # Sort data by date
-        future_data = future_data.sort_values(by='date')
-
-        # Identify the last 14 days
-        last_14_days = future_data['date'].max() - pd.Timedelta(days=14)
+        # Identify the last 14 days of the forecast, even when zoomed into an earlier window
+        # (the table's last date is unknown when its range could not be read)
+        last_date = future_range[1] if future_range[1] is not None else future_data['date'].max()
+        last_14_days = last_date - pd.Timedelta(days=14)
 
         # Plot the future data with last 14 days highlighted
-        fig_future = go.Figure()
-        fig_future.add_trace(go.Scatter(x=future_data['date'], y=future_data[st.session_state.feature_selected],
-                                        mode='lines', name=f'Projected {st.session_state.feature_selected}'))
-
-        # Highlight last 14 days
-        fig_future.add_trace(go.Scatter(
-            x=future_data[future_data['date'] > last_14_days]['date'],
-            y=future_data[future_data['date'] > last_14_days][st.session_state.feature_selected],
-            mode='lines', line=dict(color='red'),
-            name=f'Last 14 Days {st.session_state.feature_selected}'
-        ))
-
-        fig_future.update_layout(
-            title=f'Projected {st.session_state.feature_selected}',
-            xaxis_title='Date',
-            yaxis_title=st.session_state.feature_selected,
-            template='plotly_white'
-        )
-        st.plotly_chart(fig_future)
+        with metrics.timer('chart_future') as chart:
+            fig_future = go.Figure()
+            fig_future.add_trace(go.Scatter(x=future_data['date'], y=future_data[st.session_state.feature_selected],
+                                            mode='lines', name=f'Projected {st.session_state.feature_selected}'))
+
+            # Highlight last 14 days
+            fig_future.add_trace(go.Scatter(
+                x=future_data[future_data['date'] > last_14_days]['date'],
+                y=future_data[future_data['date'] > last_14_days][st.session_state.feature_selected],
+                mode='lines', line=dict(color='red'),
+                name=f'Last 14 Days {st.session_state.feature_selected}'
+            ))
+
+            fig_future.update_layout(
+                title=f'Projected {st.session_state.feature_selected}',
+                xaxis_title='Date',
+                yaxis_title=st.session_state.feature_selected,
+                template='plotly_white'
+            )
+            chart.result = fig_future
+        future_section.plotly_chart(fig_future)
+
+    show_debug_panel(lambda: st.expander('Timings', expanded=True))
+
+# Function to show the irrigation needs, water use, alerts and details of a crop, fetched in parallel
+@st.fragment
+def visualize_irrigation(engine, crop_selected):
+    # A fragment rerun is a run of its own: collect and show only its timings
+    metrics.start_session_log()
+    st.header('Crop Details and Irrigation Needs')
+
+    irrigation_result, season_water_usage, irrigation_alerts, details_result = fetch_all(
+        lambda: get_irrigation_needs(engine, crop_selected),
+        lambda: get_season_water_usage(engine, crop_selected),
+        lambda: get_irrigation_alerts(crop_selected),
+        lambda: get_crop_details(engine, crop_selected)
+    )
+    irrigation_needs, irrigation_message = irrigation_result
+    crop_details, details_message = details_result
+
+    st.subheader('Irrigation Needs')
+    show_message(irrigation_message)
+    if not irrigation_needs.empty:
+        # Ensure the date column is datetime type
+        irrigation_needs['date'] = pd.to_datetime(irrigation_needs['date'])
+
+        # Plot irrigation needs
+        fig_irrigation_needs = plot_irrigation_needs(irrigation_needs, crop_selected)
+        if fig_irrigation_needs:
+            st.plotly_chart(fig_irrigation_needs)
+            st.write("Irrigation Needs Data Shape:", irrigation_needs.shape)
+            st.write(irrigation_needs)
+
+        if not season_water_usage.empty:
+            st.subheader(f"{crop_selected} Water Use per Season")
+            st.write(season_water_usage)
+
+    # Irrigation alerts for the present and next day, precomputed by alerts.py
+    st.subheader(f"{crop_selected} Irrigation Alerts")
+    if irrigation_alerts.empty:
+        st.info("No irrigation alerts have been generated for today and tomorrow.")
+    for alert in irrigation_alerts.itertuples(index=False):
+        if alert.irrigation_needed:
+            st.warning(alert.message)
+        else:
+            st.success(alert.message)
+
+    st.subheader(f"{crop_selected} Crop Details")
+    show_message(details_message)
+    if not crop_details.empty:
+        st.write(crop_details)
+
+    st.subheader('Smart vs Traditional Irrigation')
+    this_year = pd.Timestamp('today').year
+    season_year = st.selectbox('Season sown in', list(range(this_year, 2019, -1)), index=1, key='season_year')
+    season_comparison = get_season_comparison(engine, season_year)
+    if not season_comparison.empty:
+        st.write(season_comparison)
+
+    show_debug_panel(lambda: st.expander('Timings', expanded=True))
+
+# Function to show the timings recorded during this run when 'Show timings' is ticked in the sidebar.
+# Fragments cannot write to the sidebar, so they pass a function making a container of their own,
+# only called when the panel is shown.
+def show_debug_panel(make_container):
+    if not st.session_state.get('debug_timings'):
+        return
+    container = make_container()
+    timings = pd.DataFrame(metrics.session_log())
+    if timings.empty:
+        container.write("No calls recorded in this run.")
+        return
+    container.dataframe(timings, hide_index=True)
+    container.write(f"Total: {timings['ms'].sum():.1f} ms")
 
 # Main Streamlit app
 def main():
     st.title('Smart Irrigation App')
 
+    # Serve /metrics locally when METRICS_PORT is set, and collect this run's timings
+    metrics.start_http_server()
+    metrics.start_session_log()
+
     # Sidebar for crop selection
     crop_selected = st.sidebar.selectbox('Select Crop', ['Wheat', 'Rice', 'Maize', 'Sugarcane', 'Cotton', 'Barley', 'Potatoes', 'Pulses'])
+    st.sidebar.checkbox('Show timings', key='debug_timings')
 
     # Initialize session state for page navigation
     if 'page' not in st.session_state:
@@ -197,43 +418,17 @@ def main():
         """)
         if st.button('Next'):
             next_page()
+        show_debug_panel(lambda: st.sidebar)
 
     elif st.session_state.page == 1:
-        tabs = st.tabs(["Historical & Future Data", "Crop Details & Irrigation Needs"])
+        # Only the selected view is computed; st.tabs would run both on every interaction
+        view = st.radio('View', ["Historical & Future Data", "Crop Details & Irrigation Needs"],
+                        horizontal=True, label_visibility='collapsed', key='view')
 
-        with tabs[0]:
+        if view == "Historical & Future Data":
             visualize_data(engine, st.session_state.feature_selected)
-
-        with tabs[1]:
-            st.header('Crop Details and Irrigation Needs')
-
-            st.subheader('Irrigation Needs')
-            irrigation_needs = get_irrigation_needs(engine, crop_selected)
-            if not irrigation_needs.empty:
-                # Ensure the date column is datetime type
-                irrigation_needs['date'] = pd.to_datetime(irrigation_needs['date'])
-
-                # Plot irrigation needs
-                fig_irrigation_needs = plot_irrigation_needs(irrigation_needs, crop_selected)
-                if fig_irrigation_needs:
-                    st.plotly_chart(fig_irrigation_needs)
-                    st.write("Irrigation Needs Data Shape:", irrigation_needs.shape)
-                    st.write(irrigation_needs)
-
-                # Irrigation alerts for the present and next day
-                st.subheader(f"{crop_selected} Irrigation Alerts")
-                today = pd.Timestamp('today').normalize()
-                upcoming_days = irrigation_needs[(irrigation_needs['date'] >= today) & (irrigation_needs['date'] <= today + pd.Timedelta(days=1))]
-                for index, row in upcoming_days.iterrows():
-                    if row['irrigation_amount_mm'] > 0:
-                        st.warning(f"Irrigation needed on {row['date'].date()}: {row['irrigation_amount_mm']} mm of water required")
-                    else:
-                        st.success(f"No irrigation needed on {row['date'].date()}")
-
-            st.subheader(f"{crop_selected} Crop Details")
-            crop_details = get_crop_details(engine, crop_selected)
-            if not crop_details.empty:
-                st.write(crop_details)
+        else:
+            visualize_irrigation(engine, crop_selected)
 
         if st.button('Back'):
             prev_page()
@@ -0,0 +1,175 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('smart_irrigation.metrics')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Port of the local Prometheus endpoint; the endpoint is off when unset
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+_lock = threading.Lock()
+_stages = {}
+_server = None
+_server_failed = False
+
+# Calls recorded for the current Streamlit session run, when a session log is active
+_session_log = contextvars.ContextVar('session_log', default=None)
+
+
+# Function to work out the rows and bytes of a stage's result
+def _payload(result):
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(index=False).sum())
+    if isinstance(result, np.ndarray):
+        return result.shape[0] if result.ndim else 1, result.nbytes
+    if isinstance(result, dict):
+        arrays = [value for value in result.values() if isinstance(value, np.ndarray)]
+        if arrays:
+            return arrays[0].size, sum(array.nbytes for array in arrays)
+    if hasattr(result, 'data') and isinstance(getattr(result, 'data', None), tuple):
+        # Plotly figures: count the points across traces
+        return sum(len(trace.x) for trace in result.data if trace.x is not None), None
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], pd.DataFrame):
+        # The app's fetchers return (data, message to show)
+        return _payload(result[0])
+    if isinstance(result, (list, tuple)):
+        return len(result), None
+    return None, None
+
+
+# Function to record one call of a stage
+def record(stage, seconds, rows=None, payload_bytes=None, error=False):
+    with _lock:
+        stats = _stages.setdefault(stage, {
+            'count': 0, 'errors': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+            'buckets': [0] * len(LATENCY_BUCKETS)
+        })
+        stats['count'] += 1
+        stats['errors'] += int(error)
+        stats['seconds'] += seconds
+        stats['rows'] += rows or 0
+        stats['bytes'] += payload_bytes or 0
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+
+    entry = {'stage': stage, 'ms': round(seconds * 1000, 3), 'rows': rows, 'bytes': payload_bytes, 'error': error}
+    logger.info(json.dumps(entry))
+    session = _session_log.get()
+    if session is not None:
+        session.append(entry)
+
+
+# Context manager timing a block; set .result on it to have rows and bytes recorded
+class _Timer:
+    result = None
+
+
+@contextmanager
+def timer(stage):
+    block = _Timer()
+    started = time.perf_counter()
+    error = False
+    try:
+        yield block
+    except Exception:
+        error = True
+        raise
+    finally:
+        rows, payload_bytes = _payload(block.result)
+        record(stage, time.perf_counter() - started, rows, payload_bytes, error)
+
+
+# Decorator timing every call of a function under a stage name
+def instrument(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage) as block:
+                block.result = function(*args, **kwargs)
+                return block.result
+        return wrapper
+    return decorator
+
+
+# Function to start collecting the calls made during one Streamlit session run
+def start_session_log():
+    log = []
+    _session_log.set(log)
+    return log
+
+
+# Function to get the calls collected for the current session run
+def session_log():
+    return _session_log.get() or []
+
+
+# Function to render all stages in the Prometheus text exposition format
+def render_prometheus():
+    lines = [
+        '# HELP smart_irrigation_stage_seconds Latency of pipeline and app stages',
+        '# TYPE smart_irrigation_stage_seconds histogram'
+    ]
+    with _lock:
+        stages = {stage: dict(stats, buckets=list(stats['buckets'])) for stage, stats in _stages.items()}
+    for stage, stats in sorted(stages.items()):
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            lines.append(f'smart_irrigation_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'smart_irrigation_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'smart_irrigation_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]}')
+        lines.append(f'smart_irrigation_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+    for name, key, help_text in (
+        ('smart_irrigation_stage_rows_total', 'rows', 'Rows returned by each stage'),
+        ('smart_irrigation_stage_bytes_total', 'bytes', 'Payload bytes returned by each stage'),
+        ('smart_irrigation_stage_errors_total', 'errors', 'Failed calls of each stage')
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for stage, stats in sorted(stages.items()):
+            lines.append(f'{name}{{stage="{stage}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve /metrics on a local port from a background thread (started once per process).
+# When the port is taken (e.g. by another app process) the endpoint stays off and the app keeps running.
+def start_http_server(port=METRICS_PORT, host='127.0.0.1'):
+    global _server, _server_failed
+    with _lock:
+        if _server is not None or _server_failed or port is None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        except OSError as e:
+            _server_failed = True
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
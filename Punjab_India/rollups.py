@@ -0,0 +1,160 @@
+import data_access
+from crop_calendar import CALENDARS, SEASON_ANCHOR_YEAR
+from irrigation import CROPS, IRRIGATION_EFFICIENCY
+from schema import WEATHER_COLUMNS
+
+# Start of the period a day belongs to, as a SQL expression of the date {d}, and the length of the period.
+# Seasons follow the Punjab cropping year: Kharif from April to September, Rabi from October to March.
+PERIODS = {
+    'week': ("date_trunc('week', {d})::date", '7 days'),
+    'month': ("date_trunc('month', {d})::date", '1 month'),
+    'season': ('''CASE
+        WHEN extract(month FROM {d}) BETWEEN 4 AND 9 THEN make_date(extract(year FROM {d})::int, 4, 1)
+        WHEN extract(month FROM {d}) >= 10 THEN make_date(extract(year FROM {d})::int, 10, 1)
+        ELSE make_date(extract(year FROM {d})::int - 1, 10, 1)
+    END''', '6 months')
+}
+
+# A crop's growing season starts on its sowing day, every year or every few years for crops whose season is
+# longer than a year (as in the crop calendar), and lasts the crop's season length
+CROP_SEASON_YEAR_SQL = '''(CASE
+    WHEN to_char({d}, 'MM-DD') >= '{sowing}' THEN extract(year FROM {d})::int
+    ELSE extract(year FROM {d})::int - 1
+END)'''
+CROP_SEASON_SQL = "make_date({year} - mod(mod({year} - {anchor}, {cycle}) + {cycle}, {cycle}), {month}, {day})"
+
+ROLLUP_TABLES_SQL = '''
+CREATE TABLE IF NOT EXISTS weather_rollup (
+    source_table VARCHAR NOT NULL,
+    period VARCHAR NOT NULL,
+    period_start DATE NOT NULL,
+    variable VARCHAR NOT NULL,
+    mean DECIMAL,
+    total DECIMAL,
+    minimum DECIMAL,
+    maximum DECIMAL,
+    days INTEGER,
+    PRIMARY KEY (source_table, period, variable, period_start)
+);
+CREATE TABLE IF NOT EXISTS irrigation_rollup (
+    site VARCHAR NOT NULL,
+    crop VARCHAR NOT NULL,
+    period VARCHAR NOT NULL,
+    period_start DATE NOT NULL,
+    irrigation_amount_mm DECIMAL,
+    irrigation_amount_per_hectare_litre DECIMAL,
+    gross_irrigation_mm DECIMAL,
+    irrigation_days INTEGER,
+    PRIMARY KEY (site, crop, period, period_start)
+);
+'''
+
+
+# Function to create the rollup tables, and a (site, date) index on a source table that has sites
+def ensure_tables(cur, source_table=None):
+    cur.execute(ROLLUP_TABLES_SQL)
+    if source_table is not None:
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'site'",
+            (source_table.lower(),)
+        )
+        if cur.fetchone():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {source_table}_site_date_idx ON {source_table} (site, date)")
+
+
+# Function to get the conditions selecting every period touched by the days first..last (None = all days):
+# one on the source table's date column, one on the rollup's period_start
+def _affected(expression, length, first, last, column='date'):
+    if first is None or last is None:
+        return 'TRUE', 'TRUE'
+    first_period = expression.format(d='CAST(%(first)s AS date)')
+    last_period = expression.format(d='CAST(%(last)s AS date)')
+    return (f"{column} >= {first_period} AND {column} < {last_period} + interval '{length}'",
+            f"period_start BETWEEN {first_period} AND {last_period}")
+
+
+# Function to recompute the weekly, monthly and seasonal weather rollups of a table for the periods touched by a load
+def refresh_weather(cur, table, first=None, last=None):
+    table = table.lower()
+    ensure_tables(cur, table)
+    variables = [column for column in WEATHER_COLUMNS.values() if column != 'date']
+    values = ', '.join(f"('{variable}', t.{variable})" for variable in variables)
+    for period, (expression, length) in PERIODS.items():
+        source_condition, rollup_condition = _affected(expression, length, first, last, column='t.date')
+        params = {'table': table, 'period': period, 'first': first, 'last': last}
+        cur.execute(f'''
+            DELETE FROM weather_rollup
+            WHERE source_table = %(table)s AND period = %(period)s AND {rollup_condition}
+        ''', params)
+        cur.execute(f'''
+            INSERT INTO weather_rollup (source_table, period, period_start, variable, mean, total, minimum, maximum, days)
+            SELECT %(table)s, %(period)s, {expression.format(d='t.date')} AS period_start, v.variable,
+                   avg(v.value), sum(v.value), min(v.value), max(v.value), count(v.value)
+            FROM {table} t
+            CROSS JOIN LATERAL (VALUES {values}) AS v(variable, value)
+            WHERE {source_condition}
+            GROUP BY 3, 4
+        ''', params)
+
+
+# Function to recompute the irrigation totals of a crop at a site per week, month, season and growing season
+def refresh_irrigation(cur, crop, first=None, last=None, site=None, efficiency=IRRIGATION_EFFICIENCY):
+    ensure_tables(cur)
+    calendar = CALENDARS[crop]
+    month, day = (int(part) for part in calendar.sowing.split('-'))
+    season_start = (CROP_SEASON_SQL.replace('{year}', CROP_SEASON_YEAR_SQL).replace('{sowing}', calendar.sowing)
+                    .replace('{anchor}', str(SEASON_ANCHOR_YEAR)).replace('{cycle}', str(calendar.cycle_years))
+                    .replace('{month}', str(month)).replace('{day}', str(day)))
+    periods = dict(PERIODS, crop_season=(season_start, f"{calendar.season_days()} days"))
+    # Without a site, every site growing the crop is refreshed
+    site_condition = 'site = %(site)s' if site is not None else 'TRUE'
+    for period, (expression, length) in periods.items():
+        source_condition, rollup_condition = _affected(expression, length, first, last)
+        # Growing seasons leave out the days between harvest and the next sowing
+        if period == 'crop_season':
+            source_condition += f" AND date < {expression.format(d='date')} + {calendar.season_days()}"
+        params = {'site': site, 'crop': crop, 'period': period, 'efficiency': efficiency, 'first': first, 'last': last}
+        cur.execute(f'''
+            DELETE FROM irrigation_rollup
+            WHERE {site_condition} AND crop = %(crop)s AND period = %(period)s AND {rollup_condition}
+        ''', params)
+        cur.execute(f'''
+            INSERT INTO irrigation_rollup (site, crop, period, period_start, irrigation_amount_mm,
+                                           irrigation_amount_per_hectare_litre, gross_irrigation_mm, irrigation_days)
+            SELECT site, crop, %(period)s, {expression.format(d='date')} AS period_start,
+                   sum(irrigation_amount_mm), sum(irrigation_amount_per_hectare_litre),
+                   sum(irrigation_amount_mm) / %(efficiency)s, count(*) FILTER (WHERE irrigation_amount_mm > 0)
+            FROM irrigation_need
+            WHERE {site_condition} AND crop = %(crop)s AND {source_condition}
+            GROUP BY site, crop, 4
+        ''', params)
+
+
+# Function to rebuild every rollup from the tables currently in the database
+def rebuild(conn):
+    try:
+        with conn.cursor() as cur:
+            for table in ('historical_data', 'present_with_forecast'):
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0] is not None:
+                    refresh_weather(cur, table)
+            cur.execute("SELECT to_regclass('irrigation_need')")
+            if cur.fetchone()[0] is not None:
+                for crop in CROPS:
+                    refresh_irrigation(cur, crop)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    data_access.invalidate(['weather_rollup', 'irrigation_rollup'])
+
+
+if __name__ == '__main__':
+    from loader import get_connection
+
+    conn = get_connection()
+    try:
+        rebuild(conn)
+        print("Rebuilt the weather and irrigation rollups.")
+    finally:
+        conn.close()
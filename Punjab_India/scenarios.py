@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+from crop_calendar import kc_matrix
+from forecasting import FORECAST_STEPS
+from irrigation import CROPS, IRRIGATION_EFFICIENCY, THRESHOLD_SOIL_MOISTURE, WEATHER_VARIABLES, compute_irrigation
+
+# Weather trajectories sampled per run
+N_SCENARIOS = 10000
+
+# Length in days of the blocks drawn from the history by the bootstrap
+BLOCK_DAYS = 7
+
+# Blocks start within this many days of the forecast's day of year, so they come from the same time of year
+SEASON_WINDOW_DAYS = 30
+
+# Percentiles reported for the irrigation amounts
+PERCENTILES = (10, 50, 90)
+
+
+# Function to sample weather trajectories from a fitted VAR model (see forecasting.fit_model), drawing
+# the daily shocks from its residual covariance. Returns an array of shape (scenario, day, variable).
+def simulate_var(state, steps=FORECAST_STEPS, n_scenarios=N_SCENARIOS, seed=None):
+    rng = np.random.default_rng(seed)
+    k_ar = state['k_ar']
+    n_variables = len(state['columns'])
+    shocks = rng.standard_normal((steps, n_scenarios, n_variables)) @ np.linalg.cholesky(state['sigma']).T
+
+    # Every scenario starts from the same observed differences, then follows its own shocks
+    diffs = np.empty((k_ar + steps, n_scenarios, n_variables))
+    diffs[:k_ar] = np.diff(state['levels'], axis=0)[-k_ar:, None, :] if k_ar else 0
+    for t in range(steps):
+        step = state['intercept'] + shocks[t]
+        for lag in range(k_ar):
+            step += diffs[k_ar + t - 1 - lag] @ state['coefs'][lag].T
+        diffs[k_ar + t] = step
+
+    # Reverse the differencing from the last observed levels
+    levels = np.cumsum(diffs[k_ar:], axis=0) + state['levels'][-1]
+    return levels.transpose(1, 0, 2)
+
+
+# Function to sample weather trajectories by stitching together blocks of consecutive days from the history,
+# taken from the same time of year as the forecast. Returns an array of shape (scenario, day, variable).
+def block_bootstrap(history, start, steps=FORECAST_STEPS, n_scenarios=N_SCENARIOS,
+                    block_days=BLOCK_DAYS, window_days=SEASON_WINDOW_DAYS, seed=None):
+    rng = np.random.default_rng(seed)
+    history = history.dropna()
+    values = history.to_numpy(dtype=float)
+    n_blocks = -(-steps // block_days)
+
+    # Days of the history whose day of year is close to the day each block covers
+    day_of_year = history.index.dayofyear.to_numpy()
+    blocks = []
+    for b in range(n_blocks):
+        target = (pd.Timestamp(start) + pd.Timedelta(days=b * block_days)).dayofyear
+        distance = np.abs(day_of_year - target)
+        distance = np.minimum(distance, 365 - distance)
+        candidates = np.flatnonzero((distance <= window_days) & (np.arange(len(values)) <= len(values) - block_days))
+        if len(candidates) == 0:
+            candidates = np.arange(len(values) - block_days + 1)
+        starts = rng.choice(candidates, n_scenarios)
+        blocks.append(values[starts[:, None] + np.arange(block_days)])
+    return np.concatenate(blocks, axis=1)[:, :steps]
+
+
+# Function to push weather scenarios through the irrigation calculation for every crop at once, and summarize
+# them per crop and day: the probability that irrigation is needed, the expected amount and percentile bands.
+# scenarios has shape (scenario, day, variable) with the variables named by columns.
+@metrics.instrument('irrigation_scenarios')
+def irrigation_risk(scenarios, columns, dates, crops=CROPS, sowing=None, percentiles=PERCENTILES,
+                    threshold=THRESHOLD_SOIL_MOISTURE, efficiency=IRRIGATION_EFFICIENCY):
+    dates = pd.DatetimeIndex(dates)
+    et0, precipitation, soil_moisture = (
+        np.clip(scenarios[:, :, columns.index(variable)], 0, None) for variable in WEATHER_VARIABLES
+    )
+    kc = kc_matrix(dates.to_numpy(dtype='datetime64[D]'), crops, sowing)
+    # (crop, day) -> (crop, scenario, day) as a view, so every crop shares the same scenarios
+    kc = np.broadcast_to(kc[:, None, :], (len(crops),) + et0.shape)
+    result = compute_irrigation(et0, precipitation, soil_moisture, kc, threshold=threshold, efficiency=efficiency)
+
+    amount = result['irrigation_amount']
+    bands = np.percentile(amount, percentiles, axis=1)
+    summary = {
+        'crop': np.repeat(list(crops), len(dates)),
+        'date': np.tile(dates, len(crops)),
+        'p_irrigation_needed': (amount > 0).mean(axis=1).ravel(),
+        'expected_irrigation_mm': amount.mean(axis=1).ravel(),
+        'expected_gir_mm': result['gir'].mean(axis=1).ravel()
+    }
+    for p, band in zip(percentiles, bands):
+        summary[f"irrigation_mm_p{p}"] = band.ravel()
+    return pd.DataFrame(summary)
+
+
+# Function to run the scenarios for the days after a fitted model's last observation.
+# method='var' samples the model's residuals; method='bootstrap' resamples blocks of history.
+def run(state=None, history=None, method='var', steps=FORECAST_STEPS, n_scenarios=N_SCENARIOS,
+        crops=CROPS, sowing=None, seed=None):
+    if method == 'var':
+        columns = state['columns']
+        start = state['last_date'] + pd.Timedelta(days=1)
+        scenarios = simulate_var(state, steps, n_scenarios, seed)
+    elif method == 'bootstrap':
+        columns = list(history.columns)
+        start = history.index[-1] + pd.Timedelta(days=1)
+        scenarios = block_bootstrap(history, start, steps, n_scenarios, seed=seed)
+    else:
+        raise ValueError(f"Unknown scenario method: {method}")
+    dates = pd.date_range(start, periods=steps, freq='D')
+    return irrigation_risk(scenarios, columns, dates, crops, sowing)
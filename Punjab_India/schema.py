@@ -0,0 +1,43 @@
+# Alternative column names found in the source files, mapped to the names used after ingestion
+COLUMN_ALIASES = {
+    'et0_fao_evapotranspiration (mm)': 'ET₀ (mm)',
+    'Unnamed: 0': 'date'
+}
+
+# Mapping from the daily weather columns to the database columns
+WEATHER_COLUMNS = {
+    'date': 'date',
+    'temperature_2m (°C)': 'temperature_2m_c',
+    'relative_humidity_2m (%)': 'relative_humidity_2m',
+    'precipitation (mm)': 'precipitation_mm',
+    'ET₀ (mm)': 'et₀_mm',
+    'wind_speed_10m (km/h)': 'wind_speed_10m_kmh',
+    'soil_temperature_28_to_100cm (°C)': 'soil_temperature_28_to_100cm_c',
+    'soil_moisture_28_to_100cm (m³/m³)': 'soil_moisture_28_to_100cm_m3m3',
+    'shortwave_radiation_instant (W/m²)': 'shortwave_radiation_instant_wm2'
+}
+
+# Mapping from the irrigation schedule columns to the database columns
+IRRIGATION_COLUMNS = {
+    'date': 'date',
+    'irrigation_amount(mm)': 'irrigation_amount_mm',
+    'irrigation_amount_per_hectare(liters)': 'irrigation_amount_per_hectare_litre',
+    'growth_stage': 'growth_stage'
+}
+
+
+# Mapping from the notebook's crop details columns to the crop_parameters columns
+CROP_DETAIL_COLUMNS = {
+    'Sowing Season': 'sowing_season',
+    'Harvesting Season': 'harvesting_season',
+    'Duration (days)': 'duration_days',
+    'Kc Initial': 'kc_initial',
+    'Kc Development': 'kc_development',
+    'Kc Mid-Season': 'kc_mid_season',
+    'Kc Late Season': 'kc_late_season'
+}
+
+
+# Function to bring a weather dataframe to the common column names
+def normalize_columns(df):
+    return df.rename(columns={old: new for old, new in COLUMN_ALIASES.items() if old in df.columns})
@@ -0,0 +1,109 @@
+import numpy as np
+
+import data_access
+import metrics
+import weather_store
+
+# Upper bound on points sent to the browser for a single chart trace
+MAX_POINTS = 2000
+
+# Unzoomed series spanning more than this many days are charted from the loader's rollup of this period
+ROLLUP_MIN_DAYS = 365
+ROLLUP_PERIOD = 'week'
+
+# Weather store series holding the data of each table, for charts read from the store
+STORE_KINDS = {'historical_data': 'daily', 'present_with_forecast': 'forecast'}
+
+
+# Function to pick at most n_out point indices that keep the visual shape of the line (Largest-Triangle-Three-Buckets)
+def lttb_indices(x, y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+
+        # Area of the triangle formed by the previous pick, each candidate and the next bucket's average
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+# Function to pick the minimum and maximum point of each bucket, so peaks survive downsampling
+def minmax_indices(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    n_buckets = n_out // 2
+    bucket = (np.arange(n) * n_buckets) // n
+    # Sort by value inside each bucket: the first entry of a bucket is its minimum, the last its maximum
+    order = np.lexsort((y, bucket))
+    sorted_buckets = bucket[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    lasts = np.r_[firsts[1:] - 1, n - 1]
+    return np.unique(np.concatenate([order[firsts], order[lasts]]))
+
+
+# Function to reduce a date/value frame to at most max_points rows
+@metrics.instrument('downsample')
+def downsample(df, value_column, max_points=MAX_POINTS, method='lttb', date_column='date'):
+    df = df.dropna(subset=[value_column])
+    if len(df) <= max_points:
+        return df
+
+    y = df[value_column].to_numpy(dtype=float)
+    if method == 'minmax':
+        indices = minmax_indices(y, max_points)
+    elif method == 'lttb':
+        x = df[date_column].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+        indices = lttb_indices(x, y, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return df.iloc[indices]
+
+
+# Function to fetch columns of a weather table for a date window, with the window pushed into SQL,
+# or into the Parquet reader when a weather store root and site are given
+def fetch_columns(engine, table, columns, start=None, end=None, store_root=None, site=None):
+    columns = ['date'] + [column for column in columns if column != 'date']
+    if store_root is not None:
+        return weather_store.read_table_columns(store_root, STORE_KINDS[table.lower()], site, columns, start, end)
+    return data_access.fetch_table(engine, table, columns, start=start, end=end)
+
+
+# Function to fetch a chart-ready series for a date window
+def fetch_series(engine, table, feature, start=None, end=None, max_points=MAX_POINTS, method='lttb',
+                 store_root=None, site=None):
+    df = fetch_columns(engine, table, [feature], start, end, store_root, site)
+    return downsample(df, feature, max_points=max_points, method=method)
+
+
+# Function to fetch a chart-ready series of a table's period means from the weather rollup kept by the loader
+def fetch_rollup_series(engine, table, feature, period=ROLLUP_PERIOD):
+    df = data_access.fetch_weather_rollup(engine, table, feature, period)
+    df = df[['period_start', 'mean']].rename(columns={'period_start': 'date', 'mean': feature})
+    df[feature] = df[feature].astype(float)
+    return df
+
+
+# Function to get the first and last date of a table's series, from the same source as fetch_series
+def date_range(engine, table, store_root=None, site=None):
+    if store_root is not None:
+        return weather_store.date_range(store_root, STORE_KINDS[table.lower()], site)
+    return data_access.fetch_date_range(engine, table)
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregation
+from benchmark import synthetic_hourly
+from schema import normalize_columns
+
+
+@pytest.fixture
+def export(tmp_path):
+    hourly = synthetic_hourly(1).iloc[:24 * 45].copy()
+    # A few missing readings: the notebook's means skip them, and so must the running counts
+    hourly.loc[[5, 30, 31, 500], 'temperature_2m (°C)'] = np.nan
+    path = tmp_path / 'hourly.csv'
+    hourly.to_csv(path, index=False)
+    return path
+
+
+# Function to aggregate an export the way the notebook (PUNJAB_2.ipynb) does, in one groupby over every row
+def _notebook_daily(path):
+    punjab_2 = pd.read_csv(path)
+    punjab_2['timestamp'] = pd.to_datetime(punjab_2['time'])
+    punjab_2['date'] = punjab_2['timestamp'].dt.date
+    punjab_daily_data = punjab_2.groupby('date').agg(aggregation.AGGREGATIONS).reset_index()
+    punjab_daily_data['date'] = pd.to_datetime(punjab_daily_data['date'])
+    return normalize_columns(punjab_daily_data)
+
+
+# Chunk sizes that end chunks inside a day, on a day boundary, a few rows at a time, and in a single chunk
+@pytest.mark.parametrize('chunk_size', [37, 24 * 3, 11, aggregation.CHUNK_SIZE])
+def test_chunked_aggregation_matches_notebook(export, chunk_size):
+    daily = aggregation.aggregate_daily(str(export), chunk_size=chunk_size)
+    expected = _notebook_daily(export)
+    assert daily['date'].tolist() == expected['date'].tolist()
+    pd.testing.assert_frame_equal(daily.drop(columns='date'), expected.drop(columns='date'),
+                                  check_exact=False, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from crop_calendar import CALENDARS, DEFAULT_KC
+
+# The notebook's 2022/23 season (PUNJAB_2.ipynb) as (crop, first day, last day, Kc, stage)
+NOTEBOOK_2022_SEASON = [
+    ('Wheat', '2022-10-01', '2022-10-30', 0.35, 'Initial'),
+    ('Wheat', '2022-11-01', '2022-12-10', 0.75, 'Crop Development'),
+    ('Wheat', '2022-12-11', '2023-02-10', 1.1, 'Heading & Grain filling'),
+    ('Wheat', '2023-02-11', '2023-04-10', 0.7, 'Maturity & Ripening'),
+    ('Maize', '2022-10-01', '2022-10-31', 0.4, 'Initial'),
+    ('Maize', '2022-11-01', '2022-12-31', 0.775, 'Development'),
+    ('Maize', '2023-01-01', '2023-02-28', 1.125, 'Mid-Season'),
+    ('Maize', '2023-03-01', '2023-04-30', 0.85, 'Late Season'),
+    ('Sugarcane', '2022-10-01', '2022-12-31', 0.4, 'Initial'),
+    ('Sugarcane', '2023-01-01', '2023-03-31', 0.85, 'Tillering and Shooting'),
+    ('Sugarcane', '2023-04-01', '2023-09-30', 1.2, 'Canopy Development'),
+    ('Sugarcane', '2023-10-01', '2023-12-31', 0.75, 'Maturity & Ripening'),
+    ('Potatoes', '2023-01-01', '2023-02-28', 0.5, 'Initial'),
+    ('Potatoes', '2023-03-01', '2023-04-30', 0.8, 'Crop Development'),
+    ('Potatoes', '2023-05-01', '2023-06-30', 1.15, 'Tuber Formation'),
+    ('Potatoes', '2023-07-01', '2023-08-31', 0.75, 'Maturity')
+]
+
+
+@pytest.mark.parametrize('crop, first, last, kc, stage', NOTEBOOK_2022_SEASON)
+def test_matches_notebook_2022_season(crop, first, last, kc, stage):
+    dates = np.arange(np.datetime64(first), np.datetime64(last) + 1)
+    kcs, stages = CALENDARS[crop].lookup(dates)
+    assert (kcs == kc).all()
+    assert (stages == stage).all()
+
+
+@pytest.mark.parametrize('crop, kc, stage', [('Maize', 1.125, 'Mid-Season'), ('Potatoes', 0.5, 'Initial')])
+def test_leap_day_stays_in_february_stage(crop, kc, stage):
+    kcs, stages = CALENDARS[crop].lookup(np.array(['2020-02-29', '2024-02-29'], dtype='datetime64[D]'))
+    assert (kcs == kc).all()
+    assert (stages == stage).all()
+
+
+def test_sugarcane_seasons_are_not_cut_short():
+    dates = np.arange(np.datetime64('2015-01-01'), np.datetime64('2031-01-01'))
+    kcs, stages = CALENDARS['Sugarcane'].lookup(dates)
+    counts = {stage: int((stages == stage).sum()) for stage in np.unique(stages)}
+    # Sown every other October, each season runs its full 457 days
+    assert counts['Initial'] == counts['Maturity & Ripening'] == 8 * 92
+    assert (kcs[stages == 'Unknown'] == DEFAULT_KC).all()
+
+
+def test_shifted_sowing_moves_the_calendar():
+    kcs, stages = CALENDARS['Wheat'].lookup(np.array(['2022-10-15'], dtype='datetime64[D]'), shift_days=30)
+    assert stages[0] == 'Unknown'
+    kcs, stages = CALENDARS['Wheat'].lookup(np.array(['2022-11-15'], dtype='datetime64[D]'), shift_days=30)
+    assert stages[0] == 'Initial'
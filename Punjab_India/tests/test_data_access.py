@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import data_access
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_access, 'DATA_VERSION_FILE', str(tmp_path / '.data_version'))
+    monkeypatch.setattr(data_access, '_cache', data_access.QueryCache())
+
+
+def _engine(path, values):
+    engine = create_engine(f"sqlite:///{path}")
+    pd.DataFrame({'date': ['2023-01-01', '2023-01-02'], 'sent_on': ['2023-01-02', '2023-01-01'],
+                  'value': values}).to_sql('readings', engine, index=False)
+    return engine
+
+
+def test_engines_do_not_share_cached_frames(tmp_path):
+    first = _engine(tmp_path / 'first.db', [1.0, 2.0])
+    second = _engine(tmp_path / 'second.db', [3.0, 4.0])
+    assert data_access.fetch_table(first, 'readings')['value'].tolist() == [1.0, 2.0]
+    assert data_access.fetch_table(second, 'readings')['value'].tolist() == [3.0, 4.0]
+    first.dispose()
+    second.dispose()
+
+
+def test_date_column_is_part_of_the_key(tmp_path):
+    engine = _engine(tmp_path / 'readings.db', [1.0, 2.0])
+    by_date = data_access.fetch_table(engine, 'readings', start='2023-01-02')
+    by_sent_on = data_access.fetch_table(engine, 'readings', start='2023-01-02', date_column='sent_on')
+    assert by_date['value'].tolist() == [2.0]
+    assert by_sent_on['value'].tolist() == [1.0]
+    engine.dispose()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.api import VAR
+
+import forecasting
+
+STEPS = forecasting.FORECAST_STEPS
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2021-01-01', periods=500, freq='D')
+    season = np.sin(2 * np.pi * np.arange(len(dates)) / 365)
+    return pd.DataFrame({
+        'temperature': 25 + 8 * season + np.cumsum(rng.normal(0, 0.5, len(dates))),
+        'humidity': 60 - 10 * season + np.cumsum(rng.normal(0, 0.8, len(dates))),
+        'soil_moisture': 0.27 + np.cumsum(rng.normal(0, 0.002, len(dates)))
+    }, index=dates)
+
+
+# Function to forecast with statsmodels itself: fit on the differences of fit_history, then forecast from the
+# last lags of the differences of history and undo the differencing from its last levels
+def _statsmodels_forecast(fit_history, history, steps=STEPS):
+    model_fit = VAR(fit_history.diff().dropna()).fit(maxlags=forecasting.MAX_LAGS, ic='aic')
+    diff = history.diff().dropna().to_numpy()
+    predicted = model_fit.forecast(diff[-model_fit.k_ar:], steps)
+    return np.cumsum(predicted, axis=0) + history.to_numpy()[-1]
+
+
+def test_forecast_matches_statsmodels(history):
+    state = forecasting.fit_model(history)
+    np.testing.assert_allclose(forecasting.forecast(state).to_numpy(), _statsmodels_forecast(history, history),
+                               rtol=0, atol=1e-9)
+
+
+def test_updated_model_matches_statsmodels_on_the_full_series(history):
+    head, tail = history.iloc[:-30], history.iloc[-30:]
+    state = forecasting.update_model(forecasting.fit_model(head), tail)
+
+    result = forecasting.forecast(state)
+    assert result.index[0] == history.index[-1] + pd.Timedelta(days=1)
+    np.testing.assert_allclose(result.to_numpy(), _statsmodels_forecast(head, history), rtol=0, atol=1e-9)
+
+
+def test_update_in_pieces_matches_one_update(history):
+    head = history.iloc[:-30]
+    state = forecasting.fit_model(head)
+    once = forecasting.update_model(state, history.iloc[-30:])
+    pieces = forecasting.update_model(forecasting.update_model(state, history.iloc[-30:-12]), history.iloc[-12:])
+    np.testing.assert_array_equal(forecasting.forecast(pieces).to_numpy(), forecasting.forecast(once).to_numpy())
+
+
+def test_update_with_a_gap_needs_a_refit(history):
+    state = forecasting.fit_model(history.iloc[:-30])
+    assert forecasting.update_model(state, history.iloc[-29:]) is None
+    assert forecasting.update_model(state, history.iloc[-30:].drop(history.index[-20])) is None
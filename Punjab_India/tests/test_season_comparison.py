@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import data_access
+from crop_calendar import CALENDARS
+from irrigation import CROPS, TRADITIONAL_IRRIGATION_MM
+
+SITE = 'punjab_2'
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_access, 'DATA_VERSION_FILE', str(tmp_path / '.data_version'))
+    monkeypatch.setattr(data_access, '_cache', data_access.QueryCache())
+    engine = create_engine(f"sqlite:///{tmp_path / 'irrigation.db'}")
+    # One mm of net irrigation every day of 2022-2024 for every crop
+    dates = pd.date_range('2022-01-01', '2024-12-31').strftime('%Y-%m-%d')
+    pd.concat([pd.DataFrame({'site': SITE, 'crop': crop, 'date': dates, 'irrigation_amount_mm': 1.0})
+               for crop in CROPS]).to_sql('irrigation_need', engine, index=False)
+    pd.DataFrame({
+        'crop': list(CROPS),
+        'sowing_day': [CALENDARS[crop].sowing for crop in CROPS],
+        'season_days': [CALENDARS[crop].season_days() for crop in CROPS],
+        'traditional_irrigation_mm': [TRADITIONAL_IRRIGATION_MM[crop] for crop in CROPS]
+    }).to_sql('crop_parameters', engine, index=False)
+    yield engine
+    engine.dispose()
+
+
+def _smart_irrigation(engine, season_year):
+    df = data_access.fetch_season_comparison(engine, season_year, SITE, efficiency=1.0)
+    return df.set_index('crop')['smart_irrigation_mm']
+
+
+def test_sums_each_crop_over_its_season(engine):
+    smart = _smart_irrigation(engine, 2022)
+    for crop in CROPS:
+        assert smart[crop] == CALENDARS[crop].season_days()
+
+
+def test_sugarcane_off_year_counts_the_season_still_running():
+    # Sown in 2022 and harvested at the end of 2023: 2023 has no sowing of its own
+    first, last = CALENDARS['Sugarcane'].season_window(2023)
+    assert first == np.datetime64('2022-10-01') and last == np.datetime64('2023-12-31')
+
+
+def test_sugarcane_off_year_matches_the_crop_season_rollup(engine):
+    # The whole 2022/23 season, as the crop_season rollup counts it, not the tail from the sowing day of 2023
+    assert _smart_irrigation(engine, 2023)['Sugarcane'] == CALENDARS['Sugarcane'].season_days()
+    assert _smart_irrigation(engine, 2024)['Sugarcane'] == (pd.Timestamp('2024-12-31') - pd.Timestamp('2024-10-01')).days + 1
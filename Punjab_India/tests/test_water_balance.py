@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import water_balance
+
+RESULTS = ('depletion', 'ks', 'eta', 'deep_percolation', 'irrigation', 'irrigation_per_hectare', 'gir')
+
+
+@pytest.fixture
+def daily():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2022-01-01', '2023-12-31')
+    return pd.DataFrame({
+        'date': dates,
+        'ET₀ (mm)': rng.uniform(1, 8, len(dates)),
+        'precipitation (mm)': np.where(rng.random(len(dates)) < 0.1, rng.exponential(15, len(dates)), 0),
+        'soil_moisture_28_to_100cm (m³/m³)': rng.uniform(0.2, 0.3, len(dates))
+    })
+
+
+@pytest.mark.parametrize('split', ['2022-06-30', '2023-02-28', '2023-12-30'])
+def test_restart_from_checkpoint_matches_full_run(daily, tmp_path, split):
+    full = water_balance.run(daily)
+    first = water_balance.run(daily[daily['date'] <= split])
+    path = tmp_path / 'checkpoint.npz'
+    water_balance.save_checkpoint(first['checkpoint'], path)
+    rest = water_balance.run(daily[daily['date'] > split].reset_index(drop=True),
+                             checkpoint=water_balance.load_checkpoint(path))
+
+    for name in RESULTS:
+        np.testing.assert_array_equal(np.concatenate([first[name], rest[name]], axis=-1), full[name])
+    np.testing.assert_array_equal(rest['checkpoint']['depletion'], full['checkpoint']['depletion'])
+
+
+def test_checkpoint_must_end_the_day_before_the_data(daily):
+    checkpoint = water_balance.run(daily[daily['date'] <= '2022-06-30'])['checkpoint']
+    with pytest.raises(ValueError, match='Checkpoint ends on'):
+        water_balance.run(daily[daily['date'] > '2022-07-01'].reset_index(drop=True), checkpoint=checkpoint)
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import weather_store
+
+MULTI_LOCATION_EXPORT = '''location_id,latitude,longitude,elevation,utc_offset_seconds,timezone,timezone_abbreviation
+0,30.9,75.85,247.0,19800,Asia/Kolkata,IST
+1,31.6,74.87,234.0,19800,Asia/Kolkata,IST
+
+location_id,time,temperature_2m (°C),precipitation (mm)
+'''
+
+
+@pytest.fixture
+def export(tmp_path):
+    rows = [f"{location},2023-01-0{day}T{hour:02d}:00,{10 * (location + 1) + hour},{0.1 * location}"
+            for location in (0, 1) for day in (1, 2) for hour in range(24)]
+    path = tmp_path / 'export.csv'
+    path.write_text(MULTI_LOCATION_EXPORT + '\n'.join(rows) + '\n', encoding='utf-8')
+    return path
+
+
+def test_multi_location_export_is_stored_per_location(export, tmp_path):
+    root = tmp_path / 'store'
+    weather_store.ingest_csv(str(export), str(root), site='punjab')
+
+    for location in (0, 1):
+        hourly = weather_store.read(str(root), 'hourly', f"punjab_{location}")
+        daily = weather_store.read(str(root), 'daily', f"punjab_{location}")
+        assert len(hourly) == 48 and 'location_id' not in hourly.columns
+        assert hourly['temperature_2m (°C)'].iloc[0] == 10 * (location + 1)
+        assert daily['date'].tolist() == list(pd.to_datetime(['2023-01-01', '2023-01-02']))
+        assert daily['temperature_2m (°C)'].iloc[0] == 10 * (location + 1) + 11.5
+    assert not (root / 'hourly' / 'site=punjab').exists()
+
+
+def test_rows_of_several_locations_are_refused(export, tmp_path):
+    df = weather_store.read_source_csv(str(export))
+    with pytest.raises(ValueError, match='2 locations'):
+        weather_store.write(df, str(tmp_path / 'store'), 'hourly', 'punjab')
@@ -0,0 +1,137 @@
+import numpy as np
+
+import metrics
+from crop_calendar import kc_matrix
+from irrigation import CROPS, IRRIGATION_EFFICIENCY, LITRES_PER_MM_HECTARE
+
+# Volumetric water content (m³/m³) at field capacity and wilting point of the loam soils of central Punjab
+# (FAO-56 Table 19, middle of the loam range)
+FIELD_CAPACITY = 0.25
+WILTING_POINT = 0.12
+
+# Maximum effective rooting depth in metres (FAO-56 Table 22)
+ROOT_DEPTH_M = {
+    'Wheat': 1.5, 'Rice': 0.5, 'Maize': 1.0, 'Sugarcane': 1.2,
+    'Cotton': 1.0, 'Barley': 1.0, 'Potatoes': 0.4, 'Pulses': 0.6
+}
+
+# Management-allowed depletion: share of the total available water that can go before irrigating (FAO-56 Table 22)
+ALLOWED_DEPLETION = {
+    'Wheat': 0.55, 'Rice': 0.20, 'Maize': 0.55, 'Sugarcane': 0.65,
+    'Cotton': 0.65, 'Barley': 0.55, 'Potatoes': 0.35, 'Pulses': 0.45
+}
+
+
+# Function to get the total available water (mm) of the root zone: 1000 (θFC - θWP) Zr
+def total_available_water(root_depth, field_capacity=FIELD_CAPACITY, wilting_point=WILTING_POINT):
+    return 1000 * (field_capacity - wilting_point) * np.asarray(root_depth, dtype=float)
+
+
+# Function to turn a measured soil moisture (m³/m³) into the root-zone depletion (mm) it corresponds to
+def depletion_from_moisture(soil_moisture, root_depth, field_capacity=FIELD_CAPACITY, wilting_point=WILTING_POINT):
+    taw = total_available_water(root_depth, field_capacity, wilting_point)
+    return np.clip(1000 * (field_capacity - np.asarray(soil_moisture, dtype=float)) * np.asarray(root_depth), 0, taw)
+
+
+# Function to run the FAO-56 daily root-zone water balance for a whole batch at once (fields, crops, scenarios...).
+# etc and precipitation have shape (..., day); taw, allowed_depletion, initial_depletion and efficiency broadcast
+# against the batch shape (...). Each day the depletion grows by the actual ET (ETc reduced by water stress once
+# the depletion passes the allowed share) and shrinks by rain; rain beyond field capacity percolates below the root zone.
+# When the depletion passes the allowed share of TAW, the field is irrigated back to field capacity.
+@metrics.instrument('water_balance')
+def simulate(etc, precipitation, taw, allowed_depletion, initial_depletion, efficiency=IRRIGATION_EFFICIENCY,
+             irrigate=True):
+    etc = np.asarray(etc, dtype=float)
+    precipitation = np.asarray(precipitation, dtype=float)
+    shape = np.broadcast_shapes(etc.shape, precipitation.shape)
+    batch, n_days = shape[:-1], shape[-1]
+
+    # Days first, so every step works on one contiguous slice of the batch
+    etc = np.ascontiguousarray(np.moveaxis(np.broadcast_to(etc, shape), -1, 0))
+    precipitation = np.ascontiguousarray(np.moveaxis(np.broadcast_to(precipitation, shape), -1, 0))
+    taw = np.broadcast_to(np.asarray(taw, dtype=float), batch)
+    raw = np.broadcast_to(np.asarray(allowed_depletion, dtype=float), batch) * taw
+    depletion = np.array(np.broadcast_to(np.asarray(initial_depletion, dtype=float), batch))
+
+    results = {name: np.empty((n_days,) + batch) for name in ('depletion', 'ks', 'eta', 'deep_percolation', 'irrigation')}
+    for t in range(n_days):
+        # Water stress coefficient: 1 until the readily available water is used up, then falling to 0 at TAW
+        ks = np.clip((taw - depletion) / np.maximum(taw - raw, 1e-9), 0, 1)
+        eta = ks * etc[t]
+        depletion = depletion - precipitation[t] + eta
+        deep_percolation = np.maximum(-depletion, 0)
+        depletion = np.clip(depletion, 0, taw)
+
+        irrigation = np.where(depletion > raw, depletion, 0) if irrigate else np.zeros(batch)
+        depletion = depletion - irrigation
+
+        results['depletion'][t] = depletion
+        results['ks'][t] = ks
+        results['eta'][t] = eta
+        results['deep_percolation'][t] = deep_percolation
+        results['irrigation'][t] = irrigation
+
+    # Back to (..., day), like the inputs
+    results = {name: np.moveaxis(values, 0, -1) for name, values in results.items()}
+    results['irrigation'] = results['irrigation'].round(2)
+    results['irrigation_per_hectare'] = (results['irrigation'] * LITRES_PER_MM_HECTARE).round(2)
+    results['gir'] = results['irrigation'] / np.asarray(efficiency, dtype=float)[..., None]
+    results['final_depletion'] = depletion
+    return results
+
+
+# Function to run the water balance of every crop over daily weather (the notebook's daily columns), optionally
+# continuing from a checkpoint. Without one, the first day's soil_moisture_28_to_100cm sets the starting depletion.
+# Returns the simulate() arrays with shape (crop, day) and the checkpoint to continue from the day after.
+def run(daily, crops=CROPS, sowing=None, checkpoint=None, efficiency=IRRIGATION_EFFICIENCY):
+    dates = daily['date'].to_numpy(dtype='datetime64[D]')
+    if checkpoint is not None:
+        if checkpoint['date'] + np.timedelta64(1, 'D') != dates[0]:
+            raise ValueError(f"Checkpoint ends on {checkpoint['date']}, the data starts on {dates[0]}")
+        if checkpoint['crops'] != list(crops):
+            raise ValueError(f"Checkpoint is for crops {checkpoint['crops']}, not {list(crops)}")
+
+    root_depth = np.array([ROOT_DEPTH_M[crop] for crop in crops])
+    taw = total_available_water(root_depth)
+    if checkpoint is not None:
+        initial = checkpoint['depletion']
+    else:
+        initial = depletion_from_moisture(daily['soil_moisture_28_to_100cm (m³/m³)'].iloc[0], root_depth)
+
+    kc = kc_matrix(dates, crops, sowing)
+    result = simulate(kc * daily['ET₀ (mm)'].to_numpy(), daily['precipitation (mm)'].to_numpy(),
+                      taw, [ALLOWED_DEPLETION[crop] for crop in crops], initial, efficiency)
+    result['checkpoint'] = {'date': dates[-1], 'crops': list(crops), 'depletion': result['final_depletion']}
+    return result
+
+
+# Function to save a checkpoint of the water balance state
+def save_checkpoint(checkpoint, path):
+    np.savez(path, date=np.array(checkpoint['date'], dtype='datetime64[D]'),
+             crops=np.array(checkpoint['crops']), depletion=checkpoint['depletion'])
+
+
+# Function to load a saved checkpoint, or None if there is none
+def load_checkpoint(path):
+    try:
+        with np.load(path) as data:
+            return {'date': data['date'][()], 'crops': list(data['crops']), 'depletion': data['depletion']}
+    except FileNotFoundError:
+        return None
+
+
+# Function to turn the (crop, day) result of run() into one frame per crop, with the notebook's column names
+def to_frames(daily, result, crops=CROPS):
+    frames = {}
+    for i, crop in enumerate(crops):
+        df = daily[['date']].copy()
+        df['crop'] = crop
+        df['root_zone_depletion(mm)'] = result['depletion'][i]
+        df['Ks'] = result['ks'][i]
+        df['ETa (mm)'] = result['eta'][i]
+        df['deep_percolation(mm)'] = result['deep_percolation'][i]
+        df['irrigation_amount(mm)'] = result['irrigation'][i]
+        df['irrigation_amount_per_hectare(liters)'] = result['irrigation_per_hectare'][i]
+        df['GIR'] = result['gir'][i]
+        frames[crop] = df.reset_index(drop=True)
+    return frames
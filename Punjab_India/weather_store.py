@@ -0,0 +1,186 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aggregation import aggregate_daily, read_metadata
+from schema import WEATHER_COLUMNS, normalize_columns
+
+# Default location of the store, next to the app
+STORE_ROOT = os.getenv('WEATHER_STORE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weather_data'))
+
+
+# Function to get the directory holding one kind of series (hourly, daily, forecast) for a site
+def _site_dir(root, kind, site):
+    return os.path.join(root, kind, f"site={site}")
+
+
+# Function to load a CSV export once with a normalized schema: parsed timestamps, float values, common names
+def read_source_csv(path):
+    _, skiprows = read_metadata(path) if _has_metadata_block(path) else ({}, 0)
+    df = normalize_columns(pd.read_csv(path, skiprows=skiprows, encoding='utf-8'))
+    time_column = 'time' if 'time' in df.columns else 'date'
+    df[time_column] = pd.to_datetime(df[time_column])
+    value_columns = [column for column in df.columns if column not in (time_column, 'location_id')]
+    df[value_columns] = df[value_columns].astype('float64')
+    return df.sort_values(time_column).reset_index(drop=True)
+
+
+# Function to tell an Open-Meteo export with a metadata block (single- or multi-location) from a plain CSV
+def _has_metadata_block(path):
+    with open(path, encoding='utf-8') as f:
+        return f.readline().startswith(('latitude,', 'location_id,latitude,'))
+
+
+# Function to drop the location_id column of rows that come from one location. A site holds a single location,
+# so rows of several locations are refused instead of being merged into one series.
+def single_location(df, source='The rows'):
+    if 'location_id' not in df.columns:
+        return df
+    locations = sorted(df['location_id'].unique())
+    if len(locations) > 1:
+        raise ValueError(f"{source} hold {len(locations)} locations ({', '.join(map(str, locations))}); "
+                         f"ingest a multi-location export with ingest_csv, which stores each location as its own site")
+    return df.drop(columns='location_id')
+
+
+# Function to split rows by location into (site, rows) pairs: a single location keeps the site's name,
+# and each location of a multi-location export becomes the site <site>_<location_id>
+def split_locations(df, site):
+    if 'location_id' not in df.columns or df['location_id'].nunique() <= 1:
+        return [(site, single_location(df))]
+    return [(f"{site}_{location}", part.drop(columns='location_id'))
+            for location, part in df.groupby('location_id', sort=True)]
+
+
+# Function to write a normalized dataframe of one location into the store, one Parquet file per year
+def write(df, root, kind, site):
+    df = single_location(df)
+    time_column = 'time' if 'time' in df.columns else 'date'
+    for year, part in df.groupby(df[time_column].dt.year):
+        _write_year(part, root, kind, site, year)
+
+
+# Function to merge rows into the store: rows at timestamps already stored replace them, the rest are added.
+# Only the year partitions the rows fall in are rewritten.
+def upsert(df, root, kind, site):
+    df = single_location(df)
+    time_column = 'time' if 'time' in df.columns else 'date'
+    for year, part in df.groupby(df[time_column].dt.year):
+        path = os.path.join(_site_dir(root, kind, site), f"year={year}", 'data.parquet')
+        if os.path.exists(path):
+            stored = pq.read_table(path, memory_map=True).to_pandas()
+            part = pd.concat([stored, part], ignore_index=True)
+            part = part.drop_duplicates(time_column, keep='last').sort_values(time_column)
+        _write_year(part, root, kind, site, year)
+
+
+# Function to replace one year partition of a site
+def _write_year(part, root, kind, site, year):
+    year_dir = os.path.join(_site_dir(root, kind, site), f"year={year}")
+    os.makedirs(year_dir, exist_ok=True)
+    table = pa.Table.from_pandas(part.reset_index(drop=True), preserve_index=False)
+    # Write next to the old file and swap, so readers never see a half-written partition.
+    # The leading underscore keeps the dataset reader from picking up the temporary file.
+    tmp_path = os.path.join(year_dir, '_data.parquet.tmp')
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(year_dir, 'data.parquet'))
+
+
+# Function to drop the rows of a site before a day; whole years before it are removed without being read
+def trim(root, kind, site, start):
+    site_dir = _site_dir(root, kind, site)
+    if not os.path.isdir(site_dir):
+        return
+    start = pd.Timestamp(start)
+    time_column = 'time' if kind == 'hourly' else 'date'
+    for name in os.listdir(site_dir):
+        if not name.startswith('year='):
+            continue
+        year = int(name.split('=', 1)[1])
+        year_dir = os.path.join(site_dir, name)
+        if year < start.year:
+            shutil.rmtree(year_dir)
+        elif year == start.year:
+            stored = pq.read_table(os.path.join(year_dir, 'data.parquet'), memory_map=True).to_pandas()
+            kept = stored[stored[time_column] >= start]
+            if kept.empty:
+                shutil.rmtree(year_dir)
+            elif len(kept) < len(stored):
+                _write_year(kept, root, kind, site, year)
+
+
+# Function to ingest a CSV export into the store; hourly exports also get their daily aggregates written.
+# Each location of a multi-location export is stored as its own site (split_locations).
+def ingest_csv(path, root=STORE_ROOT, kind=None, site='punjab_2'):
+    df = read_source_csv(path)
+    if kind is None:
+        kind = 'hourly' if 'time' in df.columns else 'daily'
+    for location_site, part in split_locations(df, site):
+        write(part, root, kind, location_site)
+    if kind == 'hourly':
+        for location_site, part in split_locations(aggregate_daily(path), site):
+            write(part, root, 'daily', location_site)
+    return kind, len(df)
+
+
+# Function to read only the requested columns and date range of a site, memory-mapping the files
+def read(root, kind, site, columns=None, start=None, end=None):
+    site_dir = _site_dir(root, kind, site)
+    time_column = 'time' if kind == 'hourly' else 'date'
+    if columns is not None:
+        columns = [time_column] + [column for column in columns if column != time_column]
+    if not os.path.isdir(site_dir):
+        return pd.DataFrame(columns=columns or [time_column])
+
+    # Year partitions outside the range are skipped without being opened
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters += [('year', '>=', start.year), (time_column, '>=', start)]
+    if end is not None:
+        end = pd.Timestamp(end)
+        # A date-only end on hourly data includes that whole day
+        if kind == 'hourly' and end == end.normalize():
+            end = end + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        filters += [('year', '<=', end.year), (time_column, '<=', end)]
+
+    table = pq.read_table(site_dir, columns=columns, filters=filters or None,
+                          memory_map=True, partitioning='hive')
+    df = table.to_pandas()
+    if 'year' in df.columns:
+        df = df.drop(columns='year')
+    return df.sort_values(time_column).reset_index(drop=True)
+
+
+# Function to read a daily series from the store under the database column names used by the app
+def read_table_columns(root, kind, site, columns, start=None, end=None):
+    store_names = {table_name: store_name for store_name, table_name in WEATHER_COLUMNS.items()}
+    df = read(root, kind, site, [store_names[column] for column in columns], start, end)
+    return df.rename(columns=WEATHER_COLUMNS)
+
+
+# Function to get the first and last timestamp stored for a site
+def date_range(root, kind, site):
+    df = read(root, kind, site, columns=[])
+    if df.empty:
+        return None, None
+    return df.iloc[0, 0], df.iloc[-1, 0]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingest Open-Meteo CSV exports into the columnar weather store')
+    parser.add_argument('csv', nargs='+', help='CSV files to ingest')
+    parser.add_argument('--site', default='punjab_2',
+                        help='Site name the files belong to (<site>_<location_id> for each location of a multi-location export)')
+    parser.add_argument('--kind', choices=['hourly', 'daily', 'forecast'], help='Series kind (detected when omitted)')
+    parser.add_argument('--root', default=STORE_ROOT, help='Store directory')
+    args = parser.parse_args()
+
+    for path in args.csv:
+        kind, rows = ingest_csv(path, args.root, args.kind, args.site)
+        print(f"Ingested {rows} {kind} rows from {path}")